@@ -0,0 +1,177 @@
+"""Cross-filtering between the 311 dashboard charts, done in the browser.
+
+The page carries the request cube summed down to the charted dimensions,
+plus request counts per map unit (point or grid cell) and status, as base64
+little-endian uint32 arrays. Clicking a bar, slice or month selects that label
+and every other chart is re-counted from those arrays with ``Plotly.restyle``,
+so the size of the page and the cost of a click depend on the number of
+labels and grid cells, not on the number of requests.
+"""
+import base64
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.figure_page import escape_script
+
+
+def encode_counts(counts):
+    """Base64 of ``counts`` as little-endian uint32, the layout ``Uint32Array`` reads"""
+    return base64.b64encode(np.ascontiguousarray(counts, dtype="<u4").tobytes()).decode("ascii")
+
+
+def label_codes(values, labels):
+    """Position of each value in ``labels``, -1 where it is missing"""
+    return pd.Categorical(values, categories=labels).codes.astype(np.int64)
+
+
+def cube_slice(cube, dims):
+    """The cube summed over every dimension not in ``dims``, as {dims, labels, shape, counts}"""
+    counts = cube.counts_by(dims).to_numpy()
+    shape = [len(cube.labels[dim]) for dim in dims]
+    return {
+        "dims": list(dims),
+        "labels": {dim: cube.labels[dim] for dim in dims},
+        "shape": shape,
+        "counts": encode_counts(counts.reshape(shape)),
+    }
+
+
+def cross_filter_script(cube, charts, map_chart=None, total_id=None):
+    """Script wiring the charts in ``charts`` ({dimension: chart}) to filter each other.
+
+    A chart is {"div": div id, "labels": trace attribute holding its labels,
+    "values": trace attributes to fill with the counts}. Each chart counts
+    the requests matching the selections on the other charts; clicking the
+    selected label again, or double-clicking a chart, clears selections.
+
+    ``map_chart`` is {"div", "mode", "dims", "counts"} with ``counts`` holding
+    one row per map unit and one column per combination of labels of
+    ``dims``, in cube label order. ``total_id`` is the element showing the
+    number of matching requests.
+    """
+    payload = {"cube": cube_slice(cube, list(charts)), "charts": charts, "total": total_id}
+    if map_chart is not None:
+        counts = np.asarray(map_chart["counts"])
+        shape = [len(counts)] + [len(cube.labels[dim]) for dim in map_chart["dims"]]
+        payload["map"] = {
+            "div": map_chart["div"],
+            "mode": map_chart["mode"],
+            "dims": [None] + list(map_chart["dims"]),
+            "shape": shape,
+            "counts": encode_counts(counts.reshape(shape)),
+        }
+    payload_json = escape_script(json.dumps(payload, separators=(",", ":"), ensure_ascii=False))
+    return f"""<script>
+(function() {{
+    var payload = {payload_json};
+    function decode(slice) {{
+        var bytes = atob(slice.counts), buffer = new Uint8Array(bytes.length);
+        for (var i = 0; i < bytes.length; i++) {{ buffer[i] = bytes.charCodeAt(i); }}
+        slice.counts = new Uint32Array(buffer.buffer);
+        slice.strides = slice.shape.map(function(_, axis) {{
+            return slice.shape.slice(axis + 1).reduce(function(a, b) {{ return a * b; }}, 1);
+        }});
+        return slice;
+    }}
+    // Sum the counts along ``axis`` over the cells whose other axes match ``selected``
+    function countBy(slice, axis, selected) {{
+        var out = new Array(axis < 0 ? 1 : slice.shape[axis]).fill(0);
+        var ndim = slice.shape.length;
+        for (var flat = 0; flat < slice.counts.length; flat++) {{
+            var count = slice.counts[flat];
+            if (!count) {{ continue; }}
+            var at = 0, keep = true;
+            for (var d = 0; d < ndim && keep; d++) {{
+                var position = Math.floor(flat / slice.strides[d]) % slice.shape[d];
+                if (d === axis) {{ at = position; }}
+                else if (selected[d] !== null && selected[d] !== position) {{ keep = false; }}
+            }}
+            if (keep) {{ out[at] += count; }}
+        }}
+        return out;
+    }}
+
+    var cube = decode(payload.cube);
+    var map = payload.map ? decode(payload.map) : null;
+    var dims = cube.dims;
+    var selection = {{}};
+    var positions = {{}};
+    dims.forEach(function(dim) {{
+        selection[dim] = null;
+        positions[dim] = {{}};
+        cube.labels[dim].forEach(function(label, i) {{ positions[dim][label] = i; }});
+    }});
+    function selectedAxes(dimsOfSlice, except) {{
+        return dimsOfSlice.map(function(dim) {{
+            return dim === except || !(dim in selection) ? null : selection[dim];
+        }});
+    }}
+
+    function updateChart(dim) {{
+        var chart = payload.charts[dim];
+        var div = document.getElementById(chart.div);
+        if (!div || !div.data) {{ return; }}
+        var counts = countBy(cube, dims.indexOf(dim), selectedAxes(dims, dim));
+        var labels = Array.from(div.data[0][chart.labels]);
+        var values = labels.map(function(label) {{
+            return label in positions[dim] ? counts[positions[dim][label]] : 0;
+        }});
+        var update = {{}};
+        chart.values.forEach(function(attr) {{ update[attr] = [values]; }});
+        var chosen = selection[dim] === null ? -1 : labels.indexOf(cube.labels[dim][selection[dim]]);
+        if (div.data[0].type === 'pie') {{
+            update.pull = [labels.map(function(_, i) {{ return i === chosen ? 0.08 : 0; }})];
+        }} else {{
+            update.selectedpoints = [chosen < 0 ? null : [chosen]];
+        }}
+        Plotly.restyle(div, update, [0]);
+    }}
+
+    function updateMap() {{
+        var div = document.getElementById(map.div);
+        if (!div || !div.data) {{ return; }}
+        var counts = countBy(map, 0, selectedAxes(map.dims, null));
+        var update;
+        if (map.mode === 'points') {{
+            update = {{'marker.opacity': [counts.map(function(c) {{ return c ? 0.5 : 0; }})]}};
+        }} else if (map.mode === 'grid') {{
+            map.max = map.max || Math.max.apply(null, countBy(map, 0, map.dims.map(function() {{ return null; }})));
+            update = {{
+                customdata: [counts],
+                'marker.color': [counts],
+                'marker.size': [counts.map(function(c) {{ return c ? 4 + 12 * Math.sqrt(c / map.max) : 0; }})]
+            }};
+        }} else {{
+            update = {{z: [counts]}};
+        }}
+        Plotly.restyle(div, update, [0]);
+    }}
+
+    function update() {{
+        dims.forEach(updateChart);
+        if (map) {{ updateMap(); }}
+        var total = payload.total && document.getElementById(payload.total);
+        if (total) {{ total.textContent = countBy(cube, -1, selectedAxes(dims, null))[0].toLocaleString('en-US'); }}
+    }}
+
+    dims.forEach(function(dim) {{
+        var chart = payload.charts[dim];
+        var div = document.getElementById(chart.div);
+        if (!div || !div.on) {{ return; }}
+        div.on('plotly_click', function(event) {{
+            var label = div.data[0][chart.labels][event.points[0].pointNumber];
+            if (!(label in positions[dim])) {{ return; }}
+            selection[dim] = selection[dim] === positions[dim][label] ? null : positions[dim][label];
+            update();
+        }});
+        div.on('plotly_doubleclick', function() {{
+            dims.forEach(function(d) {{ selection[d] = null; }});
+            update();
+        }});
+    }});
+}})();
+</script>"""
@@ -1,6 +1,15 @@
+import argparse
+import csv
+import json
+import os
+import sys
 import numpy as np
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.storage import TableWriter, append_table, iter_table, read_table, write_table
+from request_cube import CUBE_DIMENSIONS, CUBE_FILE, RequestCube
+
 np.random.seed(42)
 N_REQUESTS = 6810
 START_DATE = pd.Timestamp("2024-01-01")
@@ -22,70 +31,259 @@ DEPT_PROBS = np.array([0.23,0.18,0.11,0.10,0.08,0.07,0.07,0.06,0.05,0.05])
 ORIGINS = ["Call Center", "Website", "Mobile App", "Other"]
 ORIGIN_PROBS = [0.59, 0.27, 0.08, 0.06]
 DIVISIONS = ["North", "South", "East", "West", "Central"]
+ROLLUP_COLUMNS = ["status", "origin", "department"]
+NEIGHBORHOODS = [
+    "Downtown","Brookline","Squirrel Hill","Carrick","North Oakland","Shadyside","Bloomfield","Beechview","East Liberty","Strip District"
+]
+CHUNK_SIZE = 500_000
+ROLLUP_STATE = "requests_rollups.json"
 
-def random_points_around_city(n, lat_c, lon_c, radius):
-    angles = np.random.uniform(0, 2*np.pi, n)
-    radii = np.random.beta(2,2, n) * radius 
+def random_points_around_city(n, lat_c, lon_c, radius, rng=np.random):
+    angles = rng.uniform(0, 2*np.pi, n)
+    radii = rng.beta(2,2, n) * radius 
     lat_offsets = np.cos(angles) * radii
     lon_offsets = np.sin(angles) * radii * 1.2  
     return lat_c + lat_offsets, lon_c + lon_offsets
 
-def generate_requests_log(filename="../data/requests_log.csv"):
-    created_dates = pd.to_datetime(np.random.uniform(
-        START_DATE.value, END_DATE.value, N_REQUESTS)).floor("min")
-    statuses = np.random.choice(STATUSES, N_REQUESTS, p=STATUS_PROBS)
-    categories = np.random.choice(CATEGORIES, N_REQUESTS)
-    departments = np.random.choice(DEPARTMENTS, N_REQUESTS, p=DEPT_PROBS)
-    origins = np.random.choice(ORIGINS, N_REQUESTS, p=ORIGIN_PROBS)
-    divisions = np.random.choice(DIVISIONS, N_REQUESTS)
-    neighborhoods = np.random.choice(
-        ["Downtown","Brookline","Squirrel Hill","Carrick","North Oakland","Shadyside","Bloomfield","Beechview","East Liberty","Strip District"], 
-        N_REQUESTS)
-    latitudes, longitudes = random_points_around_city(N_REQUESTS, *CITY_CENTRE, CITY_RADIUS)
+def build_requests(n, start_id=1, rng=np.random):
+    """Build ``n`` synthetic requests numbered from ``start_id``, drawing from ``rng``"""
+    created_dates = pd.to_datetime(rng.uniform(
+        START_DATE.value, END_DATE.value, n)).floor("min")
+    statuses = rng.choice(STATUSES, n, p=STATUS_PROBS)
+    categories = rng.choice(CATEGORIES, n)
+    departments = rng.choice(DEPARTMENTS, n, p=DEPT_PROBS)
+    origins = rng.choice(ORIGINS, n, p=ORIGIN_PROBS)
+    divisions = rng.choice(DIVISIONS, n)
+    neighborhoods = rng.choice(NEIGHBORHOODS, n)
+    latitudes, longitudes = random_points_around_city(n, *CITY_CENTRE, CITY_RADIUS, rng=rng)
     
-    # Build DF
-    df_req = pd.DataFrame({
-        "request_id": range(1, N_REQUESTS+1),
+    # Build DF, with fixed categories so chunks share one dictionary per column
+    return pd.DataFrame({
+        "request_id": np.arange(start_id, start_id + n),
         "created_at": created_dates,
-        "status": statuses,
-        "category": categories,
-        "department": departments,
-        "origin": origins,
-        "division": divisions,
-        "neighborhood": neighborhoods,
+        "status": pd.Categorical(statuses, categories=STATUSES),
+        "category": pd.Categorical(categories, categories=CATEGORIES),
+        "department": pd.Categorical(departments, categories=DEPARTMENTS),
+        "origin": pd.Categorical(origins, categories=ORIGINS),
+        "division": pd.Categorical(divisions, categories=DIVISIONS),
+        "neighborhood": pd.Categorical(neighborhoods, categories=NEIGHBORHOODS),
         "latitude": latitudes,
         "longitude": longitudes
     })
-    df_req.to_csv(filename, index=False)
 
-def aggregate_tables(log_csv="../data/requests_log.csv"):
-    df = pd.read_csv(log_csv, parse_dates=["created_at"])
+def generate_requests_log(filename="../data/requests_log.csv"):
+    df_req = build_requests(N_REQUESTS)
+    write_table(df_req, filename)
+
+def iter_request_chunks(n_requests, chunk_size=CHUNK_SIZE, seed=42):
+    """Yield request frames of at most ``chunk_size`` rows.
 
-    # By status
-    status_df = df.groupby("status")["request_id"].count().reset_index()
-    status_df.rename(columns={"request_id": "count"}, inplace=True)
-    status_df.to_csv("../data/requests_status.csv", index=False)
-    
-    # By origin
-    ori_df = df.groupby("origin")["request_id"].count().reset_index()
-    ori_df.rename(columns={"request_id": "count"}, inplace=True)
-    ori_df.to_csv("../data/requests_origin.csv", index=False)
-    
-    # By department (Top 10)
-    dept_df = df.groupby("department")["request_id"].count().reset_index()
-    dept_df.rename(columns={"request_id": "count"}, inplace=True)
-    dept_df = dept_df.sort_values("count", ascending=False).head(10)
-    dept_df.to_csv("../data/requests_department.csv", index=False)
-
-    # By month
-    df["month"] = df["created_at"].dt.to_period("M").astype(str)
-    mo_df = df.groupby("month")["request_id"].count().reset_index()
-    mo_df.rename(columns={"request_id": "count"}, inplace=True)
-    mo_df.to_csv("../data/requests_monthly.csv", index=False)
+    Chunk ``i`` is drawn from its own generator seeded with ``(seed, i)``, so
+    the output only depends on ``seed`` and ``chunk_size`` and any chunk can be
+    regenerated on its own.
+    """
+    for i, start in enumerate(range(0, n_requests, chunk_size)):
+        rng = np.random.default_rng([seed, i])
+        n = min(chunk_size, n_requests - start)
+        yield build_requests(n, start_id=start + 1, rng=rng)
+
+def generate_requests_log_chunked(n_requests, filename="../data/requests_log.csv",
+                                  chunk_size=CHUNK_SIZE, seed=42):
+    """Stream ``n_requests`` rows to ``filename`` one chunk at a time"""
+    with TableWriter(filename) as writer:
+        for chunk in iter_request_chunks(n_requests, chunk_size, seed):
+            writer.write(chunk)
+
+def append_requests(n_requests, filename="../data/requests_log.csv", seed=42):
+    """Append ``n_requests`` new requests to the log CSV, continuing its request ids"""
+    _, watermark = load_rollup_state(os.path.dirname(filename))
+    if watermark is not None and watermark["offset"] == os.path.getsize(filename):
+        last_id = watermark["request_id"]
+    else:
+        # The log changed since the last refresh; find its last id the slow way
+        last_id = int(read_table(filename, columns=["request_id"])["request_id"].max())
+    chunk = build_requests(n_requests, start_id=last_id + 1,
+                           rng=np.random.default_rng([seed, last_id]))
+    append_table(chunk, filename)
+
+def _bincount_labels(codes, labels):
+    codes = codes[codes >= 0]
+    return pd.Series(np.bincount(codes, minlength=len(labels)), index=pd.Index(labels), dtype="int64")
+
+def count_rollups(df):
+    """Count requests per status, origin, department and month in one pass over category codes"""
+    rollups = {}
+    for col in ROLLUP_COLUMNS:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, labels = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, labels = pd.factorize(values)
+        rollups[col] = _bincount_labels(codes, labels)
+
+    created = pd.DatetimeIndex(df["created_at"].dropna())
+    month_idx = created.year.to_numpy(dtype=np.int64) * 12 + created.month.to_numpy(dtype=np.int64) - 1
+    if len(month_idx):
+        first = month_idx.min()
+        counts = np.bincount(month_idx - first)
+        labels = [f"{m // 12}-{m % 12 + 1:02d}" for m in range(first, first + len(counts))]
+        months = pd.Series(counts, index=pd.Index(labels), dtype="int64")
+        rollups["month"] = months[months > 0]
+    else:
+        rollups["month"] = pd.Series(dtype="int64")
+    return rollups
+
+def merge_rollups(left, right):
+    return {key: left[key].add(right[key], fill_value=0).astype("int64") for key in left}
+
+def write_rollups(rollups, out_dir="../data"):
+    def to_frame(key):
+        counts = rollups[key]
+        return counts[counts > 0].sort_index().rename_axis(key).reset_index(name="count")
+
+    write_table(to_frame("status"), f"{out_dir}/requests_status.csv")
+    write_table(to_frame("origin"), f"{out_dir}/requests_origin.csv")
+
+    # Top 10 departments
+    dept_df = to_frame("department").sort_values("count", ascending=False).head(10)
+    write_table(dept_df, f"{out_dir}/requests_department.csv")
+
+    write_table(to_frame("month"), f"{out_dir}/requests_monthly.csv")
+
+def _advance_watermark(watermark, chunk):
+    if len(chunk) == 0:
+        return watermark
+    created = chunk["created_at"].max()
+    return {
+        "request_id": max(watermark["request_id"], int(chunk["request_id"].max())),
+        "created_at": max(watermark["created_at"], str(created)) if pd.notna(created) else watermark["created_at"],
+        "offset": watermark["offset"],
+    }
+
+def save_rollup_state(rollups, watermark, out_dir="../data"):
+    """Persist the full rollup counts (all departments, not just the top 10) and the watermark"""
+    state = {
+        "watermark": watermark,
+        "rollups": {key: {str(label): int(count) for label, count in counts.items()}
+                    for key, counts in rollups.items()},
+    }
+    with open(os.path.join(out_dir, ROLLUP_STATE), "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+
+def load_rollup_state(out_dir="../data"):
+    path = os.path.join(out_dir, ROLLUP_STATE)
+    if not os.path.exists(path):
+        return None, None
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    rollups = {key: pd.Series(counts, dtype="int64") for key, counts in state["rollups"].items()}
+    return rollups, state["watermark"]
+
+# Columns the rollups and the cube are counted from
+AGGREGATE_COLUMNS = ["request_id", "created_at"] + ROLLUP_COLUMNS + ["division", "neighborhood"]
+ROLLUP_READ_KWARGS = dict(
+    dtype={col: "category" for col in CUBE_DIMENSIONS[:-1]},
+    parse_dates=["created_at"],
+    date_format="%Y-%m-%d %H:%M:%S",
+)
+
+def aggregate_tables(log_csv="../data/requests_log.csv", out_dir="../data", chunksize=None):
+    """Write the status/origin/department/month rollups and the request cube of ``log_csv``.
+
+    With ``chunksize`` the log is read and counted chunk by chunk, so logs
+    larger than memory can be aggregated. The full counts are saved together
+    with a watermark of the last request processed, for ``refresh_tables``.
+    """
+    watermark = {"request_id": 0, "created_at": "", "offset": os.path.getsize(log_csv)}
+    if chunksize is None:
+        chunks = [read_table(log_csv, columns=AGGREGATE_COLUMNS, **ROLLUP_READ_KWARGS)]
+    else:
+        chunks = iter_table(log_csv, chunksize, columns=AGGREGATE_COLUMNS, **ROLLUP_READ_KWARGS)
+    rollups = cube = None
+    for chunk in chunks:
+        part = count_rollups(chunk)
+        rollups = part if rollups is None else merge_rollups(rollups, part)
+        cube = RequestCube.from_frame(chunk) if cube is None else cube.merge(RequestCube.from_frame(chunk))
+        watermark = _advance_watermark(watermark, chunk)
+    write_rollups(rollups, out_dir)
+    save_rollup_state(rollups, watermark, out_dir)
+    cube.save(os.path.join(out_dir, CUBE_FILE))
+
+def _ends_at_watermark(f, names, watermark, tail_bytes=1 << 16):
+    """Whether the row ending at the watermark offset is still the watermarked request"""
+    offset = watermark["offset"]
+    start = max(0, offset - tail_bytes)
+    f.seek(start)
+    tail = f.read(offset - start)
+    if not tail.endswith(b"\n"):
+        return False
+    lines = tail[:-1].split(b"\n")
+    if len(lines) < 2 and start > 0:
+        return False
+    row = next(csv.reader([lines[-1].decode("utf-8")]), [])
+    return len(row) == len(names) and row[names.index("request_id")] == str(watermark["request_id"])
+
+def refresh_tables(log_csv="../data/requests_log.csv", out_dir="../data", chunksize=CHUNK_SIZE):
+    """Merge requests appended to ``log_csv`` since the last run into the rollup tables.
+
+    Only the bytes past the saved watermark are read. Falls back to a full
+    ``aggregate_tables`` when there is no saved state or the log was rewritten:
+    it shrank, or the offset no longer ends a line holding the watermarked request.
+    """
+    rollups, watermark = load_rollup_state(out_dir)
+    cube_path = os.path.join(out_dir, CUBE_FILE)
+    size = os.path.getsize(log_csv)
+    if watermark is None or not os.path.exists(cube_path) or size < watermark["offset"]:
+        aggregate_tables(log_csv, out_dir, chunksize)
+        return
+
+    with open(log_csv, "rb") as f:
+        names = f.readline().decode("utf-8").strip().split(",")
+        rewritten = not _ends_at_watermark(f, names, watermark)
+    if rewritten:
+        aggregate_tables(log_csv, out_dir, chunksize)
+        return
+    if size == watermark["offset"]:
+        return
+
+    cube = RequestCube.load(cube_path)
+    with open(log_csv, "rb") as f:
+        f.seek(watermark["offset"])
+        for chunk in pd.read_csv(f, names=names, header=None, usecols=AGGREGATE_COLUMNS,
+                                 chunksize=chunksize, encoding="utf-8", **ROLLUP_READ_KWARGS):
+            chunk = chunk[chunk["request_id"] > watermark["request_id"]]
+            rollups = merge_rollups(rollups, count_rollups(chunk))
+            cube = cube.merge(RequestCube.from_frame(chunk))
+            watermark = _advance_watermark(watermark, chunk)
+    watermark["offset"] = size
+    write_rollups(rollups, out_dir)
+    save_rollup_state(rollups, watermark, out_dir)
+    cube.save(cube_path)
 
 def main():
-    generate_requests_log()
-    aggregate_tables()
+    parser = argparse.ArgumentParser(description="Generate the 311 request datasets")
+    parser.add_argument("--rows", type=int, default=None,
+                        help="stream this many requests in chunks instead of the default sample")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--append", type=int, default=None,
+                        help="append this many new requests to the existing log and refresh the rollups")
+    parser.add_argument("--refresh", action="store_true",
+                        help="only merge requests appended since the last run into the rollups")
+    args = parser.parse_args()
+
+    if args.append is not None or args.refresh:
+        if args.append:
+            append_requests(args.append, seed=args.seed)
+        refresh_tables(chunksize=args.chunk_size)
+        print("Rollups refreshed successfully!")
+        return
+
+    if args.rows is None:
+        generate_requests_log()
+    else:
+        generate_requests_log_chunked(args.rows, chunk_size=args.chunk_size, seed=args.seed)
+    aggregate_tables(chunksize=None if args.rows is None else args.chunk_size)
     
     print("All datasets generated successfully!")
 
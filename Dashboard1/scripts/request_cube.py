@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+CUBE_DIMENSIONS = ["status", "department", "origin", "division", "neighborhood", "month"]
+CUBE_FILE = "requests_cube.npz"
+
+
+def month_labels(created_at):
+    """Positional month codes of ``created_at`` and the "YYYY-MM" labels they index"""
+    created = pd.DatetimeIndex(pd.to_datetime(created_at))
+    valid = ~created.isna()
+    month_idx = np.full(len(created), -1, dtype=np.int64)
+    month_idx[valid] = created.year[valid].to_numpy(dtype=np.int64) * 12 + created.month[valid].to_numpy(dtype=np.int64) - 1
+    if not valid.any():
+        return month_idx, []
+    first, last = month_idx[valid].min(), month_idx[valid].max()
+    codes = np.where(valid, month_idx - first, -1)
+    return codes, [f"{m // 12}-{m % 12 + 1:02d}" for m in range(first, last + 1)]
+
+
+class RequestCube:
+    """Request counts for every status × department × origin × division × neighborhood × month.
+
+    ``counts`` is a dense array with one axis per dimension and ``labels``
+    the sorted labels along each axis, so a slice or cross-filter is an index into
+    the array rather than a scan of the log. On disk only the non-zero cells
+    are kept.
+    """
+
+    def __init__(self, labels, counts):
+        self.labels = {dim: list(labels[dim]) for dim in CUBE_DIMENSIONS}
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self._positions = {dim: {label: i for i, label in enumerate(self.labels[dim])} for dim in CUBE_DIMENSIONS}
+
+    @classmethod
+    def from_frame(cls, df):
+        labels, codes = {}, []
+        for dim in CUBE_DIMENSIONS[:-1]:
+            values = df[dim]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Relabel the category codes in sorted label order, like factorize(sort=True)
+                categories = np.asarray(values.cat.categories, dtype=object)
+                order = np.argsort(categories, kind="stable")
+                rank = np.empty(len(order) + 1, dtype=np.int64)
+                rank[order], rank[-1] = np.arange(len(order)), -1
+                dim_codes, dim_labels = rank[values.cat.codes.to_numpy()], list(categories[order])
+            else:
+                dim_codes, uniques = pd.factorize(values, sort=True)
+                dim_labels = list(uniques)
+            labels[dim] = dim_labels
+            codes.append(dim_codes.astype(np.int64))
+        month_codes, labels["month"] = month_labels(df["created_at"])
+        codes.append(month_codes)
+
+        shape = tuple(len(labels[dim]) for dim in CUBE_DIMENSIONS)
+        codes = np.vstack(codes)
+        codes = codes[:, (codes >= 0).all(axis=0)]
+        flat = np.ravel_multi_index(codes, shape) if codes.size else np.zeros(0, dtype=np.int64)
+        return cls(labels, np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape))
+
+    def _expand(self, labels):
+        counts = np.zeros(tuple(len(labels[dim]) for dim in CUBE_DIMENSIONS), dtype=np.int64)
+        positions = []
+        for dim in CUBE_DIMENSIONS:
+            position = {label: i for i, label in enumerate(labels[dim])}
+            positions.append([position[label] for label in self.labels[dim]])
+        counts[np.ix_(*positions)] = self.counts
+        return counts
+
+    def merge(self, other):
+        """Sum of two cubes, with their axes aligned by label"""
+        if self.labels == other.labels:
+            return RequestCube(self.labels, self.counts + other.counts)
+        labels = {dim: sorted(set(self.labels[dim]) | set(other.labels[dim])) for dim in CUBE_DIMENSIONS}
+        return RequestCube(labels, self._expand(labels) + other._expand(labels))
+
+    def _index(self, filters):
+        index = []
+        for dim in CUBE_DIMENSIONS:
+            selected = filters.get(dim)
+            if selected is None:
+                index.append(np.arange(len(self.labels[dim])))
+                continue
+            selected = [selected] if isinstance(selected, str) else list(selected)
+            index.append(np.array([self._positions[dim][label] for label in selected
+                                   if label in self._positions[dim]], dtype=np.int64))
+        return np.ix_(*index), index
+
+    def counts_by(self, dims, **filters):
+        """Counts grouped by ``dims`` (one name or a list) over the cells matching ``filters``.
+
+        Each filter is a label or a list of labels of one dimension, e.g.
+        ``cube.counts_by("department", status="Closed", month=["2024-01", "2024-02"])``.
+        """
+        single = isinstance(dims, str)
+        dims = [dims] if single else list(dims)
+        selector, index = self._index(filters)
+        sub = self.counts[selector]
+        axes = tuple(i for i, dim in enumerate(CUBE_DIMENSIONS) if dim not in dims)
+        summed = sub.sum(axis=axes)
+        # Summed axes drop out in cube order; put the rest in the requested order
+        kept = [dim for dim in CUBE_DIMENSIONS if dim in dims]
+        summed = np.moveaxis(summed, [kept.index(dim) for dim in dims], range(len(dims)))
+        levels = [[self.labels[dim][i] for i in index[CUBE_DIMENSIONS.index(dim)]] for dim in dims]
+        if single:
+            return pd.Series(summed, index=pd.Index(levels[0], name=dims[0]), name="count")
+        return pd.Series(summed.ravel(), index=pd.MultiIndex.from_product(levels, names=dims), name="count")
+
+    def total(self, **filters):
+        selector, _ = self._index(filters)
+        return int(self.counts[selector].sum())
+
+    def save(self, path):
+        flat = np.flatnonzero(self.counts)
+        np.savez_compressed(
+            path,
+            shape=np.array(self.counts.shape, dtype=np.int64),
+            cells=flat.astype(np.uint32 if self.counts.size < 2 ** 32 else np.uint64),
+            counts=self.counts.ravel()[flat].astype(np.uint32),
+            labels=np.array(json.dumps(self.labels, ensure_ascii=False)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            counts = np.zeros(int(np.prod(data["shape"])), dtype=np.int64)
+            counts[data["cells"]] = data["counts"]
+            return cls(json.loads(str(data["labels"])), counts.reshape(tuple(data["shape"])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slice the 311 request cube")
+    parser.add_argument("--cube", default=os.path.join("..", "data", CUBE_FILE))
+    parser.add_argument("--by", default="department", help="comma separated dimensions to group by")
+    parser.add_argument("--where", action="append", default=[], metavar="DIM=LABEL",
+                        help="keep only LABEL along DIM (repeat the flag for more labels or dimensions)")
+    args = parser.parse_args()
+
+    filters = {}
+    for condition in args.where:
+        dim, label = condition.split("=", 1)
+        filters.setdefault(dim, []).append(label)
+    counts = RequestCube.load(args.cube).counts_by(args.by.split(","), **filters)
+    print(counts[counts > 0].to_string())
+
+
+if __name__ == "__main__":
+    main()
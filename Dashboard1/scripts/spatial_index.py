@@ -0,0 +1,133 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.storage import read_table
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class GridIndex:
+    """Uniform grid over request coordinates for box, radius and per-cell count queries.
+
+    Points are sorted by cell id once, so every grid row's cells are a
+    contiguous slice of ``order``. Queries scan only the cells overlapping the
+    search box and return positional row indices into the indexed frame.
+    """
+
+    def __init__(self, lat, lon, grid_size=64):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.grid_size = grid_size
+
+        valid = ~(np.isnan(self.lat) | np.isnan(self.lon))
+        if valid.any():
+            self.lat_min, self.lat_max = self.lat[valid].min(), self.lat[valid].max()
+            self.lon_min, self.lon_max = self.lon[valid].min(), self.lon[valid].max()
+        else:
+            self.lat_min = self.lat_max = self.lon_min = self.lon_max = 0.0
+        self.lat_step = (self.lat_max - self.lat_min) / grid_size or 1.0
+        self.lon_step = (self.lon_max - self.lon_min) / grid_size or 1.0
+
+        positions = np.flatnonzero(valid)
+        cells = self._cells(self.lat[positions], self.lon[positions])
+        sort = np.argsort(cells, kind="stable")
+        self.order = positions[sort]
+        self.counts = np.bincount(cells, minlength=grid_size * grid_size)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)])
+
+    @classmethod
+    def from_frame(cls, df, grid_size=64):
+        return cls(df["latitude"], df["longitude"], grid_size)
+
+    @classmethod
+    def from_log(cls, log_csv="../data/requests_log.csv", grid_size=64):
+        return cls.from_frame(read_table(log_csv, columns=["latitude", "longitude"]), grid_size)
+
+    def _row(self, lat):
+        return np.clip(((np.asarray(lat) - self.lat_min) / self.lat_step).astype(np.int64), 0, self.grid_size - 1)
+
+    def _col(self, lon):
+        return np.clip(((np.asarray(lon) - self.lon_min) / self.lon_step).astype(np.int64), 0, self.grid_size - 1)
+
+    def _cells(self, lat, lon):
+        return self._row(lat) * self.grid_size + self._col(lon)
+
+    def cell_counts(self):
+        """Return centre latitudes, centre longitudes and counts of the non-empty cells"""
+        cells = np.flatnonzero(self.counts)
+        return (self.lat_min + (cells // self.grid_size + 0.5) * self.lat_step,
+                self.lon_min + (cells % self.grid_size + 0.5) * self.lon_step,
+                self.counts[cells])
+
+    def cell_counts_by(self, codes, n_codes):
+        """Counts per non-empty cell (in ``cell_counts`` order) and code, as a cells × ``n_codes`` array.
+
+        ``codes`` holds one integer in [0, n_codes) per indexed row; rows with
+        a negative code are left out.
+        """
+        cells = np.flatnonzero(self.counts)
+        cell_rank = np.repeat(np.arange(len(cells)), self.counts[cells])
+        codes = np.asarray(codes, dtype=np.int64)[self.order]
+        keep = codes >= 0
+        flat = cell_rank[keep] * n_codes + codes[keep]
+        return np.bincount(flat, minlength=len(cells) * n_codes).reshape(len(cells), n_codes)
+
+    def _candidates(self, lat_min, lat_max, lon_min, lon_max):
+        if (lat_min > lat_max or lon_min > lon_max
+                or lat_max < self.lat_min or lat_min > self.lat_max or lon_max < self.lon_min or lon_min > self.lon_max):
+            return np.zeros(0, dtype=np.int64)
+        row_lo, row_hi = self._row(lat_min), self._row(lat_max)
+        col_lo, col_hi = self._col(lon_min), self._col(lon_max)
+        slices = [
+            self.order[self.starts[row * self.grid_size + col_lo]:self.starts[row * self.grid_size + col_hi + 1]]
+            for row in range(row_lo, row_hi + 1)
+        ]
+        return np.concatenate(slices)
+
+    def query_box(self, lat_min, lat_max, lon_min, lon_max):
+        """Row positions of the points inside the bounding box (edges included)"""
+        idx = self._candidates(lat_min, lat_max, lon_min, lon_max)
+        lat, lon = self.lat[idx], self.lon[idx]
+        inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+        return np.sort(idx[inside])
+
+    def query_radius(self, lat, lon, radius_km):
+        """Row positions of the points within ``radius_km`` great-circle distance of (lat, lon)"""
+        # Degrees on the same sphere haversine_km measures on, so the box holds every point within reach
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        # A degree of longitude is shortest at the box edge farthest from the equator
+        farthest = max(abs(lat - dlat), abs(lat + dlat))
+        if farthest >= 90:
+            dlon = 360.0
+        else:
+            dlon = np.degrees(radius_km / (EARTH_RADIUS_KM * np.cos(np.radians(farthest))))
+        idx = self._candidates(lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+        inside = haversine_km(lat, lon, self.lat[idx], self.lon[idx]) <= radius_km
+        return np.sort(idx[inside])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query 311 requests by location")
+    parser.add_argument("--near", nargs=2, type=float, metavar=("LAT", "LON"))
+    parser.add_argument("--km", type=float, default=1.0)
+    parser.add_argument("--box", nargs=4, type=float, metavar=("LAT_MIN", "LAT_MAX", "LON_MIN", "LON_MAX"))
+    args = parser.parse_args()
+
+    index = GridIndex.from_log()
+    if args.near:
+        print(f"{len(index.query_radius(*args.near, args.km)):,} requests within {args.km} km")
+    if args.box:
+        print(f"{len(index.query_box(*args.box)):,} requests in box")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,40 @@
-import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 import warnings
 import os
+import sys
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.figure_page import FigurePage
+from common.profiling import profile_run, stage
+from common.storage import read_tables
+from cross_filter import cross_filter_script, label_codes
+from request_cube import CUBE_FILE, RequestCube
+from spatial_index import GridIndex
+
+BG_MAIN = "#1C1C2E"
+CARD = "#24243A"
+PRIMARY = "#7F74F2"
+ACCENT = "#4BC6B9"
+SECONDARY = "#F4B860"
+TERTIARY = "#FF6B6B"
+GRAY_LINE = "#5E6480"
+FONT_LABEL = "#A9B0C5"
+FONT_CARD = "#FFFFFF"
+
+MAP_POINT_LIMIT = 2000
+MAP_GRID_SIZE = 60
+# Dimensions the map follows when a chart selects one of their labels
+MAP_FILTER_DIMS = ["status"]
+CROSS_FILTER_CHARTS = {
+    "status": {"div": "status-chart", "labels": "x", "values": ["y"]},
+    "origin": {"div": "origin-chart", "labels": "labels", "values": ["values"]},
+    "department": {"div": "department-chart", "labels": "y", "values": ["x", "text"]},
+    "month": {"div": "trend-chart", "labels": "x", "values": ["y"]},
+}
+
 
 def load_data():
     # Get the directory where the script is located
@@ -19,11 +49,13 @@ def load_data():
             data_dir = "data"
     
     try:
-        reqs = pd.read_csv(os.path.join(data_dir, 'requests_log.csv'), parse_dates=['created_at'])
-        status = pd.read_csv(os.path.join(data_dir, 'requests_status.csv'))
-        origin = pd.read_csv(os.path.join(data_dir, 'requests_origin.csv'))
-        dept = pd.read_csv(os.path.join(data_dir, 'requests_department.csv'))
-        months = pd.read_csv(os.path.join(data_dir, 'requests_monthly.csv'))
+        reqs, status, origin, dept, months = read_tables([
+            (os.path.join(data_dir, 'requests_log.csv'), {"parse_dates": ['created_at']}),
+            os.path.join(data_dir, 'requests_status.csv'),
+            os.path.join(data_dir, 'requests_origin.csv'),
+            os.path.join(data_dir, 'requests_department.csv'),
+            os.path.join(data_dir, 'requests_monthly.csv'),
+        ])
     except FileNotFoundError as e:
         print(f"Error: Could not find required CSV files.")
         print(f"Looking in directory: {os.path.abspath(data_dir)}")
@@ -33,34 +65,17 @@ def load_data():
     return reqs, status, origin, dept, months
 
 
-def create_dashboard(reqs, status, origin, dept, months, output=None):
-    if output is None:
-        # Create outputs directory if it doesn't exist
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        outputs_dir = os.path.join(script_dir, "..", "outputs")
-        if not os.path.exists(outputs_dir):
-            outputs_dir = os.path.join(script_dir, "outputs")
-            if not os.path.exists(outputs_dir):
-                os.makedirs(outputs_dir)
-        output = os.path.join(outputs_dir, "dashboard.html")
-    
-    BG_MAIN = "#1C1C2E"
-    CARD = "#24243A"
-    PRIMARY = "#7F74F2"
-    ACCENT = "#4BC6B9"
-    SECONDARY = "#F4B860"
-    TERTIARY = "#FF6B6B"
-    GRAY_LINE = "#5E6480"
-    FONT_LABEL = "#A9B0C5"
-    FONT_CARD = "#FFFFFF"
+def load_cube(reqs, data_dir=None):
+    """The request cube written by data_gen, or one built from ``reqs`` if it is missing"""
+    if data_dir is None:
+        data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+    path = os.path.join(data_dir, CUBE_FILE)
+    if os.path.exists(path):
+        return RequestCube.load(path)
+    return RequestCube.from_frame(reqs)
 
-    main_kpi_html = f"""
-    <div class="kpi-content">
-        <div class="kpi-label">TOTAL REQUESTS</div>
-        <div class="kpi-value">{len(reqs):,}</div>
-    </div>
-    """
 
+def create_status_figure(status):
     status_fig = go.Figure(go.Bar(
         x=status['status'],
         y=status['count'],
@@ -77,7 +92,10 @@ def create_dashboard(reqs, status, origin, dept, months, output=None):
         xaxis=dict(title="", color=FONT_LABEL, showgrid=False),
         height=180
     )
+    return status_fig
+
 
+def create_origin_figure(origin):
     pie_colors = [PRIMARY, ACCENT, SECONDARY, TERTIARY]
     origin_fig = go.Figure(go.Pie(
         labels=origin['origin'],
@@ -106,7 +124,10 @@ def create_dashboard(reqs, status, origin, dept, months, output=None):
         height=155,
         showlegend=True
     )
+    return origin_fig
+
 
+def create_department_figure(dept):
     dept_fig = px.bar(
         dept.sort_values("count"),
         y="department",
@@ -132,7 +153,10 @@ def create_dashboard(reqs, status, origin, dept, months, output=None):
         margin=dict(l=30, r=14, t=45, b=12),
         height=260
     )
+    return dept_fig
 
+
+def create_trend_figure(months):
     months = months.sort_values("month")
     ts_fig = go.Figure(go.Scatter(
         x=months["month"], y=months["count"], mode="lines+markers",
@@ -149,31 +173,130 @@ def create_dashboard(reqs, status, origin, dept, months, output=None):
         yaxis=dict(title="Requests", gridcolor=GRAY_LINE, color=FONT_LABEL),
         height=180
     )
+    return ts_fig
+
+
+def default_map_mode(reqs):
+    return "points" if len(reqs) <= MAP_POINT_LIMIT else "density"
+
+
+def map_unit_counts(reqs, cube, mode):
+    """Requests per map unit (a point or a non-empty grid cell) and ``MAP_FILTER_DIMS`` labels"""
+    shape = [len(cube.labels[dim]) for dim in MAP_FILTER_DIMS]
+    codes = [label_codes(reqs[dim], cube.labels[dim]) for dim in MAP_FILTER_DIMS]
+    valid = np.all([c >= 0 for c in codes], axis=0)
+    combined = np.where(valid, np.ravel_multi_index([np.where(valid, c, 0) for c in codes], shape), -1)
+    n_codes = int(np.prod(shape))
+    if mode == "points":
+        counts = np.zeros((len(reqs), n_codes), dtype=np.int64)
+        counts[np.flatnonzero(valid), combined[valid]] = 1
+        return counts
+    return GridIndex.from_frame(reqs, MAP_GRID_SIZE).cell_counts_by(combined, n_codes)
+
+
+def create_map_figure(reqs, mode=None):
+    """Plot request locations.
+
+    ``mode`` is "points" (every request, hover shows the category), "grid"
+    (one marker per grid cell sized and coloured by its count) or "density"
+    (a heat layer over the grid counts). By default logs up to
+    ``MAP_POINT_LIMIT`` rows are drawn as points and larger ones as density,
+    so the payload stays bounded by the grid size.
+    """
+    if mode is None:
+        mode = default_map_mode(reqs)
+
+    if mode == "points":
+        map_fig = go.Figure(go.Scattermapbox(
+            lat=reqs["latitude"],
+            lon=reqs["longitude"],
+            mode="markers",
+            hovertext=reqs["category"],
+            hovertemplate="<b>%{hovertext}</b><extra></extra>",
+            marker=dict(size=6, color=ACCENT, opacity=0.5)
+        ))
+    else:
+        with stage("transform", "map grid"):
+            lat, lon, counts = GridIndex.from_frame(reqs, MAP_GRID_SIZE).cell_counts()
+        if mode == "density":
+            map_fig = go.Figure(go.Densitymapbox(
+                lat=lat,
+                lon=lon,
+                z=counts,
+                radius=14,
+                colorscale=[[0, "rgba(75,198,185,0)"], [0.4, ACCENT], [1, TERTIARY]],
+                showscale=False,
+                hovertemplate="%{z:,} requests<extra></extra>"
+            ))
+        elif mode == "grid":
+            map_fig = go.Figure(go.Scattermapbox(
+                lat=lat,
+                lon=lon,
+                mode="markers",
+                customdata=counts,
+                hovertemplate="%{customdata:,} requests<extra></extra>",
+                marker=dict(
+                    size=4 + 12 * np.sqrt(counts / counts.max()),
+                    color=counts,
+                    colorscale=[[0, ACCENT], [1, TERTIARY]],
+                    opacity=0.7
+                )
+            ))
+        else:
+            raise ValueError(f"Unknown map mode: {mode!r}")
 
     # MAP without watermark
-    subset = reqs.sample(n=min(len(reqs), 2000), random_state=3)
-    map_fig = px.scatter_mapbox(
-        subset,
-        lat="latitude",
-        lon="longitude",
-        hover_name="category",
-        color_discrete_sequence=[ACCENT],
-        zoom=12.5,
-        opacity=0.6,
-        height=195,
-        width=390
-    )
     map_fig.update_layout(
         mapbox_style="carto-positron",
-        mapbox_center={"lat": subset["latitude"].mean(), "lon": subset["longitude"].mean()},
+        mapbox_zoom=12.5,
+        mapbox_center={"lat": reqs["latitude"].mean(), "lon": reqs["longitude"].mean()},
         paper_bgcolor=CARD,
         margin=dict(l=2, r=2, t=50, b=2),
         title="<span style='font-weight:750; color=%s;'>Request Locations</span>" % FONT_CARD,
+        showlegend=False,
+        height=195,
+        width=390,
         annotations=[]  # Watermark removed
     )
-    map_fig.update_traces(marker=dict(size=6, opacity=0.5))
+    return map_fig
+
+
+def create_dashboard(reqs, status, origin, dept, months, output=None, cube=None):
+    if output is None:
+        # Create outputs directory if it doesn't exist
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        outputs_dir = os.path.join(script_dir, "..", "outputs")
+        if not os.path.exists(outputs_dir):
+            outputs_dir = os.path.join(script_dir, "outputs")
+            if not os.path.exists(outputs_dir):
+                os.makedirs(outputs_dir)
+        output = os.path.join(outputs_dir, "dashboard.html")
+    
+    main_kpi_html = f"""
+    <div class="kpi-content">
+        <div class="kpi-label">TOTAL REQUESTS</div>
+        <div class="kpi-value" id="kpi-total">{len(reqs):,}</div>
+    </div>
+    """
+
+    page = FigurePage(output)
+    charts = CROSS_FILTER_CHARTS
+    map_mode = default_map_mode(reqs)
+    status_html = page.figure(create_status_figure, status, div_id=charts["status"]["div"])
+    origin_html = page.figure(create_origin_figure, origin, div_id=charts["origin"]["div"])
+    map_html = page.figure(create_map_figure, reqs, mode=map_mode, div_id="map-chart")
+    dept_html = page.figure(create_department_figure, dept, div_id=charts["department"]["div"])
+    trend_html = page.figure(create_trend_figure, months, div_id=charts["month"]["div"])
+
+    with stage("transform", "cross-filter slices"):
+        if cube is None:
+            cube = load_cube(reqs)
+        map_chart = {"div": "map-chart", "mode": map_mode, "dims": MAP_FILTER_DIMS,
+                     "counts": map_unit_counts(reqs, cube, map_mode)}
+        page.add_script(cross_filter_script(cube, charts, map_chart, total_id="kpi-total"))
 
-    html = f"""
+    with stage("assemble"):
+        html = f"""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -650,25 +773,30 @@ def create_dashboard(reqs, status, origin, dept, months, output=None):
             <div class="dash-subtitle">A monthly breakdown of 311 activity across the city.</div>
             <div class="card-grid">
                 <div class="card kpi-card">{main_kpi_html}</div>
-                <div class="card status-card">{status_fig.to_html(full_html=False, include_plotlyjs='cdn')}</div>
-                <div class="card origin-card">{origin_fig.to_html(full_html=False, include_plotlyjs=False)}</div>
-                <div class="card map-card">{map_fig.to_html(full_html=False, include_plotlyjs=False)}</div>
-                <div class="card dept-card">{dept_fig.to_html(full_html=False, include_plotlyjs=False)}</div>
-                <div class="card trend-card">{ts_fig.to_html(full_html=False, include_plotlyjs=False)}</div>
+                <div class="card status-card">{status_html}</div>
+                <div class="card origin-card">{origin_html}</div>
+                <div class="card map-card">{map_html}</div>
+                <div class="card dept-card">{dept_html}</div>
+                <div class="card trend-card">{trend_html}</div>
             </div>
         </div>
+        {page.scripts()}
     </body>
     </html>
     """
 
-    with open(output, "w", encoding="utf-8") as f:
+    with stage("write") as record, open(output, "w", encoding="utf-8") as f:
         f.write(html)
+        record["output_bytes"] = len(html.encode("utf-8"))
     print(f"Dashboard created successfully!")
 
 
 def main():
-    reqs, status, origin, dept, months = load_data()
-    create_dashboard(reqs, status, origin, dept, months)
+    with profile_run("Dashboard1"):
+        with stage("load"):
+            reqs, status, origin, dept, months = load_data()
+            cube = load_cube(reqs)
+        create_dashboard(reqs, status, origin, dept, months, cube=cube)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.storage import iter_table, write_table
+
+CHUNK_SIZE = 1_000_000
+TOTAL_COLUMNS = ["trips", "revenue", "total_miles", "shipping_cost", "on_time"]
+TRIP_COLUMNS = ["date", "revenue", "total_miles", "shipping_cost", "on_time"]
+PERIOD_FORMATS = {"M": "%b %Y", "W": "Week of %d %b %Y", "D": "%d %b %Y"}
+# Weeks run Monday to Sunday
+PERIOD_FREQS = {"W": "W-SUN"}
+
+
+def period_totals(trips, freq="M"):
+    """Trip count and revenue/miles/cost/on-time sums per period ("M", "W" or "D"), as a PeriodIndexed frame"""
+    periods = pd.PeriodIndex(pd.to_datetime(trips["date"]), freq=PERIOD_FREQS.get(freq, freq))
+    if not len(periods):
+        return pd.DataFrame(0.0, index=periods.rename("period"), columns=TOTAL_COLUMNS)
+    ordinals = periods.asi8
+    first = ordinals.min()
+    codes = ordinals - first
+    totals = {"trips": np.bincount(codes)}
+    for column in TOTAL_COLUMNS[1:]:
+        totals[column] = np.bincount(codes, weights=trips[column].to_numpy(dtype=float))
+    index = pd.PeriodIndex.from_ordinals(np.arange(first, first + len(totals["trips"])), freq=periods.freq)
+    return pd.DataFrame(totals, index=index.rename("period"))
+
+
+def merge_totals(*totals):
+    if not totals:
+        return pd.DataFrame(columns=TOTAL_COLUMNS, dtype=float)
+    return pd.concat(totals).groupby(level=0).sum()
+
+
+def _change(current, previous):
+    return (current - previous) / previous * 100 if previous else 0.0
+
+
+def period_label(period, freq="M"):
+    return pd.Period(period, freq=PERIOD_FREQS.get(freq, freq)).start_time.strftime(PERIOD_FORMATS.get(freq, "%Y-%m-%d"))
+
+
+def compute_kpis(totals, freq="M"):
+    """KPI rows (metric, value, delta, delta_unit, prefix, suffix, period) for the latest period in ``totals``.
+
+    Deltas compare with the period before it: percent change ("%") for the
+    amounts, percentage points ("pp") for the on-time rate. ``period`` labels
+    the period the values cover, e.g. "Dec 2024"; without any trips every
+    value is 0 and the period is "No trips".
+    """
+    totals = totals.sort_index()
+    if totals.empty:
+        current = previous = pd.Series(0.0, index=TOTAL_COLUMNS)
+    else:
+        current = totals.iloc[-1]
+        previous = totals.iloc[-2] if len(totals) > 1 else current
+
+    def rates(row):
+        cost_per_mile = row["shipping_cost"] / row["total_miles"] if row["total_miles"] else 0.0
+        on_time = row["on_time"] / row["trips"] * 100 if row["trips"] else 0.0
+        return cost_per_mile, on_time
+
+    cost_per_mile, on_time = rates(current)
+    previous_cost_per_mile, previous_on_time = rates(previous)
+    metrics = [
+        ("Revenue", round(current["revenue"] / 1e6, 1), _change(current["revenue"], previous["revenue"]), "%", "$", "M"),
+        ("Total Miles", round(current["total_miles"] / 1e6, 1),
+         _change(current["total_miles"], previous["total_miles"]), "%", "", "M"),
+        ("Shipping Cost", round(current["shipping_cost"] / 1e6, 1),
+         _change(current["shipping_cost"], previous["shipping_cost"]), "%", "$", "M"),
+        ("Avg Cost per Mile", round(cost_per_mile, 2), _change(cost_per_mile, previous_cost_per_mile), "%", "$", ""),
+        ("On-Time Delivery", round(on_time, 1), on_time - previous_on_time, "pp", "", "%"),
+    ]
+    df = pd.DataFrame(metrics, columns=["metric", "value", "delta", "delta_unit", "prefix", "suffix"])
+    df["delta"] = df["delta"].round(1)
+    df["period"] = period_label(totals.index[-1], freq) if len(totals) else "No trips"
+    return df
+
+
+def kpis_from_csv(trips_csv="../data/trips.csv", chunksize=CHUNK_SIZE, freq="M"):
+    """Stream the trip table in chunks, so memory stays bounded by the chunk size"""
+    totals = [period_totals(chunk, freq) for chunk in iter_table(trips_csv, chunksize, columns=TRIP_COLUMNS)]
+    return compute_kpis(merge_totals(*totals), freq)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the KPIs of the latest period from the trip table")
+    parser.add_argument("--trips", default="../data/trips.csv")
+    parser.add_argument("--output", default=None, help="also write the KPIs to this CSV")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--freq", default="M", help="period unit for the deltas (M, W or D)")
+    args = parser.parse_args()
+
+    kpis = kpis_from_csv(args.trips, args.chunk_size, args.freq)
+    if args.output:
+        write_table(kpis, args.output)
+    print(kpis.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.storage import iter_table
+
+CHUNK_SIZE = 200_000
+
+
+class RunningRegression:
+    """Count, means and centred (co)moments of x and y, accumulated chunk by chunk.
+
+    Chunks are merged with the pairwise update of Chan et al., which carries
+    the same information as raw sums, squares and cross-products without
+    their cancellation on large values. Pearson r and the OLS line follow
+    from the moments.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m2_x = self.m2_y = self.c_xy = 0.0
+        self.x_min, self.x_max = np.inf, -np.inf
+
+    def update(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[valid], y[valid]
+        if len(x) == 0:
+            return self
+        chunk = RunningRegression()
+        chunk.n = len(x)
+        chunk.mean_x, chunk.mean_y = x.mean(), y.mean()
+        dx, dy = x - chunk.mean_x, y - chunk.mean_y
+        chunk.m2_x, chunk.m2_y, chunk.c_xy = dx @ dx, dy @ dy, dx @ dy
+        chunk.x_min, chunk.x_max = x.min(), x.max()
+        return self.merge(chunk)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if n == 0:
+            return self
+        dx, dy = other.mean_x - self.mean_x, other.mean_y - self.mean_y
+        weight = self.n * other.n / n
+        self.m2_x += other.m2_x + dx * dx * weight
+        self.m2_y += other.m2_y + dy * dy * weight
+        self.c_xy += other.c_xy + dx * dy * weight
+        self.mean_x += dx * other.n / n
+        self.mean_y += dy * other.n / n
+        self.x_min, self.x_max = min(self.x_min, other.x_min), max(self.x_max, other.x_max)
+        self.n = n
+        return self
+
+    def fit(self):
+        """Plain dict with n, Pearson r, OLS slope/intercept and the x range"""
+        r = self.c_xy / np.sqrt(self.m2_x * self.m2_y) if self.m2_x > 0 and self.m2_y > 0 else float("nan")
+        slope = self.c_xy / self.m2_x if self.m2_x > 0 else float("nan")
+        return {
+            "n": self.n,
+            "r": float(r),
+            "slope": float(slope),
+            "intercept": float(self.mean_y - slope * self.mean_x),
+            "x_min": float(self.x_min),
+            "x_max": float(self.x_max),
+        }
+
+
+def regression_fits(chunks, x="total_miles", y="revenue", group="trip_type"):
+    """Fit ``y`` on ``x`` over an iterable of frames; return {"All": fit, <group value>: fit, ...}"""
+    overall, groups = RunningRegression(), {}
+    for chunk in chunks:
+        overall.update(chunk[x], chunk[y])
+        for key, rows in chunk.groupby(group, observed=True):
+            groups.setdefault(key, RunningRegression()).update(rows[x], rows[y])
+    return {"All": overall.fit(), **{key: groups[key].fit() for key in sorted(groups)}}
+
+
+def regression_fits_from_csv(csv_path="../data/trips.csv", chunksize=CHUNK_SIZE):
+    columns = ["total_miles", "revenue", "trip_type"]
+    return regression_fits(iter_table(csv_path, chunksize, columns=columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Revenue vs miles regression over the trip table")
+    parser.add_argument("--csv", default="../data/trips.csv")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    for name, fit in regression_fits_from_csv(args.csv, args.chunk_size).items():
+        print(f"{name:<15} n={fit['n']:>9,}  r={fit['r']:.3f}  "
+              f"revenue = {fit['slope']:,.2f} * miles + {fit['intercept']:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
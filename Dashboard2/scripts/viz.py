@@ -1,6 +1,16 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.figure_page import FigurePage
+from common.profiling import profile_run, stage
+from common.ranking import top_n
+from common.storage import read_table
+from kpis import compute_kpis, period_totals
+from scatter_stats import regression_fits
 
 
 def load_data():
@@ -16,49 +26,63 @@ def load_data():
             data_dir = "data"
     
     try:
-        kpi_metrics = pd.read_csv(os.path.join(data_dir, "kpi_metrics.csv"))
-        trip_type = pd.read_csv(os.path.join(data_dir, "trip_type_data.csv"))
-        state_data = pd.read_csv(os.path.join(data_dir, "state_data.csv"))
-        revenue_miles_scatter = pd.read_csv(os.path.join(data_dir, "revenue_miles_scatter.csv"))
-        city_data = pd.read_csv(os.path.join(data_dir, "city_data.csv"))
+        trips = read_table(os.path.join(data_dir, "trips.csv"))
     except FileNotFoundError as e:
-        print(f"Error: Could not find CSV files. Please ensure the following files exist:")
-        print("- kpi_metrics.csv")
-        print("- trip_type_data.csv")
-        print("- state_data.csv")
-        print("- revenue_miles_scatter.csv")
-        print("- city_data.csv")
+        print(f"Error: Could not find trips.csv. Please run data_gen.py first.")
         print(f"\nLooking in directory: {os.path.abspath(data_dir)}")
         raise e
     
+    return trips
+
+
+def rollup_trips(trips):
+    """Derive every Dashboard2 table from the trip facts.
+
+    The trips are grouped once by state, city and trip type; the state, city
+    and trip-type totals are rolled up from that small cube, so they always
+    reconcile with each other and with the KPIs.
+    """
+    cube = trips.groupby(["state_code", "city", "trip_type"], observed=True)[["revenue", "total_miles"]].sum()
+    
+    state_data = cube.groupby(level="state_code", observed=True).sum().reset_index()
+    city_data = cube.groupby(level="city", observed=True).sum().reset_index()
+    city_data = city_data.sort_values("revenue", ascending=False, kind="stable").reset_index(drop=True)
+    trip_type = cube.groupby(level="trip_type", observed=True)[["total_miles"]].sum().reset_index()
+    trip_type["percentage"] = (trip_type["total_miles"] / trip_type["total_miles"].sum() * 100).round(1)
+    
+    kpi_metrics = compute_kpis(period_totals(trips))
+    revenue_miles_scatter = trips[["total_miles", "revenue", "trip_type"]]
     return kpi_metrics, trip_type, state_data, revenue_miles_scatter, city_data
 
 
-def create_kpi_indicators(kpi_metrics):
-    indicator_figs = []
-    colors = ["#A838F3", "#C084FC", "#A838F3", "#C084FC", "#A838F3"]
+# Above these row counts the scatter switches to WebGL, then to a binned heatmap
+SCATTER_GL_THRESHOLD = 5_000
+SCATTER_HISTOGRAM_THRESHOLD = 200_000
+SCATTER_BINS = 80
+FIT_COLORS = {"All": "#2D3748", "Domestic": "#D97706", "International": "#059669", "Intercom": "#DC2626"}
+
+KPI_COLORS = ["#A838F3", "#C084FC", "#A838F3", "#C084FC", "#A838F3"]
+
+
+def create_kpi_indicator(row, color):
+    prefix = "" if pd.isna(row["prefix"]) else row["prefix"]
+    suffix = "" if pd.isna(row["suffix"]) else row["suffix"]
     
-    for i, row in kpi_metrics.iterrows():
-        prefix = "" if pd.isna(row["prefix"]) else row["prefix"]
-        suffix = "" if pd.isna(row["suffix"]) else row["suffix"]
-        
-        fig = go.Figure(go.Indicator(
-            mode="number",
-            title={"text": f"<b>{str(row['metric']).upper()}</b>", "font": {"size": 14, "family": "Arial", "color": "#4A5568"}},
-            value=row["value"],
-            number={"prefix": prefix, "suffix": suffix, "font": {"size": 40, "color": colors[i % len(colors)], "family": "Arial"}}
-        ))
-        
-        fig.update_layout(
-            height=120,
-            margin=dict(t=40, b=20, l=20, r=20),
-            paper_bgcolor="rgba(0,0,0,0)",
-            plot_bgcolor="rgba(0,0,0,0)",
-        )
-        
-        indicator_figs.append(fig)
+    fig = go.Figure(go.Indicator(
+        mode="number",
+        title={"text": f"<b>{str(row['metric']).upper()}</b><br><span style='font-size:11px'>{row['period']}</span>",
+               "font": {"size": 14, "family": "Arial", "color": "#4A5568"}},
+        value=row["value"],
+        number={"prefix": prefix, "suffix": suffix, "font": {"size": 40, "color": color, "family": "Arial"}}
+    ))
     
-    return indicator_figs
+    fig.update_layout(
+        height=120,
+        margin=dict(t=52, b=14, l=20, r=20),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+    )
+    return fig
 
 
 def create_trip_type_donut(trip_type):
@@ -113,16 +137,91 @@ def create_state_analysis(state_data):
     return fig
 
 
-def create_revenue_miles_scatter(revenue_miles_scatter):
+def scatter_histogram(x, y, bins=SCATTER_BINS):
+    """Bin centres and per-cell counts of a 2D histogram, empty cells as NaN"""
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    counts[counts == 0] = np.nan
+    return (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2, counts.T
+
+
+def add_regression_overlay(fig, fits):
+    """Draw the OLS line of every fit and annotate the overall one"""
+    for name, fit in fits.items():
+        if fit["n"] < 2 or np.isnan(fit["slope"]):
+            continue
+        x = np.array([fit["x_min"], fit["x_max"]])
+        overall = name == "All"
+        fig.add_trace(go.Scatter(
+            x=x,
+            y=fit["intercept"] + fit["slope"] * x,
+            mode="lines",
+            line=dict(
+                color=FIT_COLORS.get(name, "#718096"),
+                width=2.5 if overall else 1.5,
+                dash="solid" if overall else "dot"
+            ),
+            name=f"{name} fit",
+            hovertemplate=f"<b>{name}</b><br>r = {fit['r']:.2f}<br>${fit['slope']:,.2f} per mile<extra></extra>"
+        ))
+    
+    overall = fits.get("All")
+    if overall and overall["n"] >= 2:
+        fig.add_annotation(
+            text=f"r = {overall['r']:.2f} · ${overall['slope']:,.2f}/mile · n = {overall['n']:,}",
+            xref="paper", yref="paper", x=0.02, y=0.98, xanchor="left", yanchor="top",
+            showarrow=False, font=dict(size=11, color="#2D3748"),
+            bgcolor="rgba(255,255,255,0.8)"
+        )
+
+
+def create_revenue_miles_scatter(revenue_miles_scatter, mode=None, fits=None):
+    """Plot revenue against miles.
+
+    ``mode`` is "svg" (a regular scatter), "webgl" (the same markers drawn by
+    Scattergl) or "histogram" (counts binned here into a heatmap, so the
+    payload is bounded by ``SCATTER_BINS``). By default the mode follows the
+    row count: svg up to ``SCATTER_GL_THRESHOLD``, webgl up to
+    ``SCATTER_HISTOGRAM_THRESHOLD`` and histogram beyond. ``fits`` from
+    ``scatter_stats.regression_fits`` are drawn on top as trend lines.
+    """
+    if mode is None:
+        if len(revenue_miles_scatter) <= SCATTER_GL_THRESHOLD:
+            mode = "svg"
+        elif len(revenue_miles_scatter) <= SCATTER_HISTOGRAM_THRESHOLD:
+            mode = "webgl"
+        else:
+            mode = "histogram"
+
     fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=revenue_miles_scatter["total_miles"],
-        y=revenue_miles_scatter["revenue"],
-        mode="markers",
-        marker=dict(color="#6B46C1", size=4, opacity=0.6),
-        name="Data Points",
-        hovertemplate="<b>Miles: %{x:,.0f}</b><br>Revenue: $%{y:,.0f}<extra></extra>"
-    ))
+    if mode in ("svg", "webgl"):
+        trace = go.Scatter if mode == "svg" else go.Scattergl
+        fig.add_trace(trace(
+            x=revenue_miles_scatter["total_miles"],
+            y=revenue_miles_scatter["revenue"],
+            mode="markers",
+            marker=dict(color="#6B46C1", size=4, opacity=0.6),
+            name="Data Points",
+            hovertemplate="<b>Miles: %{x:,.0f}</b><br>Revenue: $%{y:,.0f}<extra></extra>"
+        ))
+    elif mode == "histogram":
+        with stage("transform", "scatter histogram"):
+            x, y, counts = scatter_histogram(
+                revenue_miles_scatter["total_miles"].to_numpy(dtype=float),
+                revenue_miles_scatter["revenue"].to_numpy(dtype=float)
+            )
+        fig.add_trace(go.Heatmap(
+            x=x,
+            y=y,
+            z=counts,
+            colorscale=[[0, "#E9D8FD"], [0.5, "#A838F3"], [1, "#44337A"]],
+            showscale=False,
+            name="Trips",
+            hovertemplate="<b>Miles: %{x:,.0f}</b><br>Revenue: $%{y:,.0f}<br>%{z:,} trips<extra></extra>"
+        ))
+    else:
+        raise ValueError(f"Unknown scatter mode: {mode!r}")
+    if fits:
+        add_regression_overlay(fig, fits)
     
     fig.update_layout(
         title={"text": "<b>Revenue Vs TotalMiles</b>", "x": 0.02, "y": 0.95, "xanchor": "left", "font": {"size": 16, "color": "#2D3748"}},
@@ -137,8 +236,11 @@ def create_revenue_miles_scatter(revenue_miles_scatter):
     return fig
 
 
+TOP_CITIES = 20
+
+
 def create_city_analysis(city_data):
-    top_cities = city_data.head(20)
+    top_cities = top_n(city_data, "revenue", TOP_CITIES, "city", sum_cols=["revenue", "total_miles"])
     fig = go.Figure()
     fig.add_trace(go.Bar(name="Revenue", x=top_cities["city"], y=top_cities["revenue"], marker_color="#6B46C1", yaxis="y", offsetgroup=1))
     fig.add_trace(go.Bar(name="TotalMiles", x=top_cities["city"], y=top_cities["total_miles"], marker_color="#C084FC", yaxis="y2", offsetgroup=2))
@@ -158,7 +260,7 @@ def create_city_analysis(city_data):
     return fig
 
 
-def create_dashboard(kpi_metrics, trip_type, state_data, revenue_miles_scatter, city_data, output=None):
+def create_dashboard(kpi_metrics, trip_type, state_data, revenue_miles_scatter, city_data, output=None, fits=None):
     if output is None:
         # Create outputs directory if it doesn't exist
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -169,13 +271,21 @@ def create_dashboard(kpi_metrics, trip_type, state_data, revenue_miles_scatter,
                 os.makedirs(outputs_dir)
         output = os.path.join(outputs_dir, "dashboard.html")
     
-    kpi_indicators = create_kpi_indicators(kpi_metrics)
-    trip_type_donut = create_trip_type_donut(trip_type)
-    state_analysis = create_state_analysis(state_data)
-    revenue_miles_scatter = create_revenue_miles_scatter(revenue_miles_scatter)
-    city_analysis = create_city_analysis(city_data)
+    page = FigurePage(output)
+    kpi_indicators = [
+        page.figure(create_kpi_indicator, row, KPI_COLORS[i % len(KPI_COLORS)])
+        for i, (_, row) in enumerate(kpi_metrics.iterrows())
+    ]
+    trip_type_donut = page.figure(create_trip_type_donut, trip_type)
+    state_analysis = page.figure(create_state_analysis, state_data)
+    if fits is None:
+        with stage("transform", "scatter fits"):
+            fits = regression_fits([revenue_miles_scatter])
+    revenue_miles_scatter = page.figure(create_revenue_miles_scatter, revenue_miles_scatter, fits=fits)
+    city_analysis = page.figure(create_city_analysis, city_data)
     
-    custom_html = f"""
+    with stage("assemble"):
+        custom_html = f"""
     <!DOCTYPE html>
     <html>
     <head>
@@ -378,38 +488,44 @@ def create_dashboard(kpi_metrics, trip_type, state_data, revenue_miles_scatter,
             {''.join([
                 f'''
                 <div class="card kpi-card row-1 col-{i+1}">
-                    {kpi_indicators[i].to_html(full_html=False, include_plotlyjs='cdn' if i==0 else False)}
+                    {kpi_indicators[i]}
                     <div class="delta-indicator {'positive' if kpi_metrics.iloc[i]['delta'] > 0 else 'negative'}">
-                        {'+' if kpi_metrics.iloc[i]['delta'] > 0 else ''}{kpi_metrics.iloc[i]['delta']:.1f}%
+                        {'+' if kpi_metrics.iloc[i]['delta'] > 0 else ''}{kpi_metrics.iloc[i]['delta']:.1f}{kpi_metrics.iloc[i]['delta_unit']}
                     </div>
                 </div>
                 '''
                 for i in range(min(5, len(kpi_indicators)))
             ])}
             <div class="card row-2 col-1-2">
-                {trip_type_donut.to_html(full_html=False, include_plotlyjs=False)}
+                {trip_type_donut}
             </div>
             <div class="card row-2 col-3-5">
-                {state_analysis.to_html(full_html=False, include_plotlyjs=False)}
+                {state_analysis}
             </div>
             <div class="card row-3 col-1-2">
-                {revenue_miles_scatter.to_html(full_html=False, include_plotlyjs=False)}
+                {revenue_miles_scatter}
             </div>
             <div class="card row-3 col-3-5">
-                {city_analysis.to_html(full_html=False, include_plotlyjs=False)}
+                {city_analysis}
             </div>
         </div>
+        {page.scripts()}
     </body>
     </html>
     """
-    with open(output, "w") as f:
+    with stage("write") as record, open(output, "w") as f:
         f.write(custom_html)
+        record["output_bytes"] = len(custom_html.encode("utf-8"))
     print(f"Dashboard created successfully!")
 
 
 def main():
-    kpi_metrics, trip_type, state_data, revenue_miles_scatter, city_data = load_data()
-    create_dashboard(kpi_metrics, trip_type, state_data, revenue_miles_scatter, city_data)
+    with profile_run("Dashboard2"):
+        with stage("load"):
+            trips = load_data()
+        with stage("transform", "trip rollups"):
+            kpi_metrics, trip_type, state_data, revenue_miles_scatter, city_data = rollup_trips(trips)
+        create_dashboard(kpi_metrics, trip_type, state_data, revenue_miles_scatter, city_data)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+
+class BudgetTree:
+    """Parent-pointer tree over the rows of a hierarchy frame.
+
+    Node ``i`` is row ``i``. ``parent[i]`` is the row of its parent (-1 for a
+    root), ``depth[i]`` its distance from the root and ``root_division[i]`` the
+    row of its depth-1 ancestor (the node itself for divisions, -1 for the
+    root). Nodes are also numbered in depth-first order (``tin``/``tout``), so
+    ancestor checks are O(1) and a subtree is one contiguous slice of
+    ``preorder``. When a name appears on several rows, children attach to its
+    first row.
+    """
+
+    def __init__(self, names, parents):
+        self.names = np.asarray(names, dtype=object)
+        n = len(self.names)
+        first_row = pd.Series(np.arange(n), index=self.names)
+        first_row = first_row[~first_row.index.duplicated()]
+        self.parent = first_row.reindex(np.asarray(parents, dtype=object)).fillna(-1).to_numpy(dtype=np.int64)
+
+        self.depth = np.zeros(n, dtype=np.int64)
+        ancestor = self.parent.copy()
+        for _ in range(n + 1):
+            has_parent = ancestor >= 0
+            if not has_parent.any():
+                break
+            self.depth[has_parent] += 1
+            ancestor[has_parent] = self.parent[ancestor[has_parent]]
+        else:
+            raise ValueError("hierarchy contains a cycle")
+
+        self.root_division = self.ancestor_at_depth(np.arange(n), 1)
+        self._build_preorder()
+
+    @classmethod
+    def from_frame(cls, df, name_col="name", parent_col="parent"):
+        return cls(df[name_col], df[parent_col].fillna(""))
+
+    def _build_preorder(self):
+        n = len(self.names)
+        order = np.argsort(self.parent, kind="stable")
+        child_counts = np.bincount(self.parent[self.parent >= 0], minlength=n)
+        self.child_order = order[np.count_nonzero(self.parent < 0):]
+        self.child_starts = np.concatenate([[0], np.cumsum(child_counts)])
+
+        # Iterative DFS on plain lists; ~node marks leaving node
+        child_order, starts = self.child_order.tolist(), self.child_starts.tolist()
+        tin, tout, preorder = [0] * n, [0] * n, []
+        stack = np.flatnonzero(self.parent < 0)[::-1].tolist()
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                tout[~node] = len(preorder) - 1
+                continue
+            tin[node] = len(preorder)
+            preorder.append(node)
+            stack.append(~node)
+            stack.extend(reversed(child_order[starts[node]:starts[node + 1]]))
+        self.tin = np.array(tin, dtype=np.int64)
+        self.tout = np.array(tout, dtype=np.int64)
+        self.preorder = np.array(preorder, dtype=np.int64)
+
+    def paths(self, sep=" - "):
+        """Unique path id of every node ("Total Budget - Technology - Cybersecurity - Training").
+
+        Built one depth at a time with array concatenation. Siblings sharing a
+        name get " (2)", " (3)", ... suffixes so the ids stay unique.
+        """
+        paths = self.names.copy()
+        for depth in range(self.depth.max() + 1):
+            rows = np.flatnonzero(self.depth == depth)
+            if depth > 0:
+                paths[rows] = paths[self.parent[rows]] + sep + self.names[rows]
+            repeat = pd.Series(paths[rows]).groupby(paths[rows]).cumcount().to_numpy()
+            clash = repeat > 0
+            if clash.any():
+                suffixes = np.array([f" ({k + 1})" for k in repeat[clash]], dtype=object)
+                paths[rows[clash]] = paths[rows[clash]] + suffixes
+        return paths
+
+    def parent_paths(self, paths):
+        return np.where(self.parent >= 0, paths[np.maximum(self.parent, 0)], "")
+
+    def node_id(self, name):
+        return int(np.flatnonzero(self.names == name)[0])
+
+    def children(self, node):
+        return self.child_order[self.child_starts[node]:self.child_starts[node + 1]]
+
+    def ancestors(self, node):
+        """Rows from ``node``'s parent up to the root"""
+        path = []
+        node = self.parent[node]
+        while node >= 0:
+            path.append(int(node))
+            node = self.parent[node]
+        return path
+
+    def ancestor_at_depth(self, nodes, depth):
+        """Vectorized: each node's ancestor (or itself) at ``depth``, -1 where the node is shallower"""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        result = nodes.copy()
+        steps = self.depth[nodes] - depth
+        while (steps > 0).any():
+            move = steps > 0
+            result[move] = self.parent[result[move]]
+            steps[move] -= 1
+        result[steps < 0] = -1
+        return result
+
+    def is_ancestor(self, ancestor, node):
+        return self.tin[ancestor] <= self.tin[node] and self.tout[node] <= self.tout[ancestor]
+
+    def subtree(self, node):
+        """Rows of ``node`` and all its descendants, in depth-first order"""
+        return self.preorder[self.tin[node]:self.tout[node] + 1]
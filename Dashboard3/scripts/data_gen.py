@@ -1,6 +1,11 @@
+import os
+import sys
 import numpy as np
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.storage import write_table
+
 def generate_hierarchical_data(filename="../data/hierarchical_expenses.csv"):
     np.random.seed(42)
     
@@ -121,7 +126,7 @@ def generate_hierarchical_data(filename="../data/hierarchical_expenses.csv"):
     })
     
     df = pd.DataFrame(hierarchy_data)
-    df.to_csv(filename, index=False)
+    write_table(df, filename)
 
 if __name__ == "__main__":
     generate_hierarchical_data()
@@ -1,6 +1,24 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.figure_page import FigurePage
+from common.hierarchy import clear_shards, fold_split, lazy_loader_script, split_levels, write_shards
+from common.palette import family_colors
+from common.profiling import profile_run, stage
+from common.storage import read_table
+from budget_tree import BudgetTree
+
+# Smaller line items beyond this are folded into an "Other" item per category,
+# separately on the page and in each drill-down shard
+MAX_LEAVES = 500
+# Trace attribute -> node table column, for the lazily loaded subtrees
+ICICLE_SHARD_COLUMNS = {
+    "ids": "id", "labels": "name", "parents": "parent_id", "values": "value", "marker.colors": "color"
+}
 
 
 def load_data():
@@ -16,7 +34,7 @@ def load_data():
             data_dir = "data"
     
     try:
-        hierarchical = pd.read_csv(os.path.join(data_dir, "hierarchical_expenses.csv"))
+        hierarchical = read_table(os.path.join(data_dir, "hierarchical_expenses.csv"))
     except FileNotFoundError as e:
         print(f"Error: Could not find hierarchical_expenses.csv")
         print(f"Looking in directory: {os.path.abspath(data_dir)}")
@@ -25,101 +43,44 @@ def load_data():
     return hierarchical
 
 
-def fix_duplicate_names(df):
-    df_fixed = df.copy()
-    name_counts = df_fixed['name'].value_counts()
-    duplicates = name_counts[name_counts > 1].index.tolist()
-    
-    for dup_name in duplicates:
-        dup_rows = df_fixed[df_fixed['name'] == dup_name]
-        for idx, (_, row) in enumerate(dup_rows.iterrows()):
-            if row['parent'] != '':
-                new_name = f"{row['parent']} - {dup_name}"
-                df_fixed.loc[df_fixed['name'] == dup_name, 'name'] = new_name
-                children_mask = df_fixed['parent'] == dup_name
-                if children_mask.any():
-                    df_fixed.loc[children_mask, 'parent'] = new_name
-                break
-    
-    return df_fixed
-
+def fix_hierarchical_values(df, id_col='name', parent_col='parent'):
+    """Roll values up from the deepest level so every parent equals the sum of its children.
 
-def fix_hierarchical_values(df):
+    Each level is one grouped sum of the children's values by parent id,
+    mapped back onto the parent rows one level up.
+    """
     df_fixed = df.copy()
+    values = df_fixed['value'].to_numpy(dtype=float, copy=True)
+    levels = df_fixed['level'].to_numpy()
+    names = df_fixed[id_col].to_numpy()
+    parents = df_fixed[parent_col].to_numpy()
     
-    for level in range(1, df_fixed['level'].max() + 1):
-        level_parents = df_fixed[df_fixed['level'] == level - 1]['name'].unique()
-        
-        for parent in level_parents:
-            if parent == '':
-                continue
-                
-            children = df_fixed[df_fixed['parent'] == parent]
-            if len(children) == 0:
-                continue
-                
-            parent_value = df_fixed[df_fixed['name'] == parent]['value'].iloc[0]
-            children_sum = children['value'].sum()
-            
-            if abs(children_sum - parent_value) > 1:
-                df_fixed.loc[df_fixed['name'] == parent, 'value'] = children_sum
+    for level in range(levels.max(), 0, -1):
+        is_child = levels == level
+        children_sums = pd.Series(values[is_child]).groupby(parents[is_child]).sum()
+        
+        parent_rows = np.flatnonzero(levels == level - 1)
+        sums = children_sums.reindex(names[parent_rows]).to_numpy()
+        mismatch = ~np.isnan(sums) & (np.abs(sums - values[parent_rows]) > 1)
+        values[parent_rows[mismatch]] = sums[mismatch]
     
+    df_fixed['value'] = values
     return df_fixed
 
 
-def find_root_division(df, node_name, color_families):
-    current = node_name
-    visited = set()
-    
-    while current and current != '' and current not in visited:
-        visited.add(current)
-        
-        if current in color_families and current != "Total Budget":
-            return current
-            
-        parent_row = df[df['name'] == current]
-        if len(parent_row) == 0:
-            break
-            
-        parent = parent_row['parent'].iloc[0]
-        current = parent
-    
-    return None
-
-
-def adjust_color_brightness(hex_color, factor):
-    if not hex_color.startswith('#'):
-        return hex_color
-    
-    r = int(hex_color[1:3], 16)
-    g = int(hex_color[3:5], 16)
-    b = int(hex_color[5:7], 16)
-    
-    if factor < 1:
-        r = int(r * factor)
-        g = int(g * factor)
-        b = int(b * factor)
-    else:
-        r = int(r + (255 - r) * (factor - 1))
-        g = int(g + (255 - g) * (factor - 1))
-        b = int(b + (255 - b) * (factor - 1))
-    
-    r = max(0, min(255, r))
-    g = max(0, min(255, g))
-    b = max(0, min(255, b))
-    
-    return f"rgb({r},{g},{b})"
-
-
-def create_rectangular_budget_breakdown(hierarchical_df):
+def budget_nodes(hierarchical_df):
     df = hierarchical_df.copy()
     df['parent'] = df['parent'].fillna('')
     
-    duplicates = df[df.duplicated('name', keep=False)]
-    if len(duplicates) > 0:
-        df = fix_duplicate_names(df)
+    # Repeated leaf names ("Training", "Legal Fees") are told apart by their path
+    tree = BudgetTree.from_frame(df)
+    df['id'] = tree.paths()
+    df['parent_id'] = tree.parent_paths(df['id'].to_numpy())
+    df['level'] = tree.depth
+    root_rows = tree.root_division
+    df['division'] = np.where(root_rows >= 0, tree.names[np.maximum(root_rows, 0)], None)
     
-    df = fix_hierarchical_values(df)
+    df = fix_hierarchical_values(df, 'id', 'parent_id')
     df = df.sort_values(['level', 'value'], ascending=[True, False]).reset_index(drop=True)
     
     color_families = {
@@ -132,38 +93,28 @@ def create_rectangular_budget_breakdown(hierarchical_df):
         "Research & Development": "#47f0d4"
     }
     
-    color_assignments = {}
-    
-    for name, color in color_families.items():
-        color_assignments[name] = color
-    
-    for _, row in df.iterrows():
-        node_name = row['name']
-        
-        if node_name in color_assignments:
-            continue
-            
-        root_division = find_root_division(df, node_name, color_families)
-        
-        if root_division:
-            base_color = color_families[root_division]
-            level = row['level']
-            
-            if level == 2:
-                color_assignments[node_name] = adjust_color_brightness(base_color, 0.85)
-            elif level == 3:
-                color_assignments[node_name] = adjust_color_brightness(base_color, 1.15)
-            else:
-                brightness_factor = 1.1 + (level - 3) * 0.1
-                color_assignments[node_name] = adjust_color_brightness(base_color, min(brightness_factor, 1.4))
-        else:
-            fallback_colors = list(color_families.values())[1:]
-            color_assignments[node_name] = adjust_color_brightness(
-                fallback_colors[hash(node_name) % len(fallback_colors)], 1.2
-            )
-    
-    colors = [color_assignments.get(name, '#94a3b8') for name in df['name']]
+    names = df['name'].to_numpy(dtype=object)
+    levels = df['level'].to_numpy()
+    # Divisions and the root keep their own colour, deeper nodes a shade of their division's
+    own = (levels <= 1) & np.isin(names, list(color_families))
+    keys = np.where(own, names, df['division'].to_numpy(dtype=object))
+    factors = np.select(
+        [own, levels == 2, levels == 3],
+        [1.0, 0.85, 1.15],
+        np.minimum(1.1 + (levels - 3) * 0.1, 1.4)
+    )
     
+    unknown = ~np.isin(keys, list(color_families))
+    if unknown.any():
+        fallback_colors = list(color_families)[1:]
+        codes = pd.factorize(names[unknown])[0]
+        keys[unknown] = np.array(fallback_colors, dtype=object)[codes % len(fallback_colors)]
+        factors[unknown] = 1.2
+    df['color'] = family_colors(keys, color_families, factors)
+    return df
+
+
+def create_rectangular_budget_breakdown(df):
     value_range = df['value'].max() - df['value'].min()
     small_values = df[df['value'] < value_range * 0.05]
     
@@ -173,8 +124,9 @@ def create_rectangular_budget_breakdown(hierarchical_df):
         dynamic_pad = 0.8
     
     fig = go.Figure(go.Icicle(
+        ids=df['id'],
         labels=df['name'],
-        parents=df['parent'],
+        parents=df['parent_id'],
         values=df['value'],
         textinfo="label+value",
         texttemplate="<b>%{label}</b><br>$%{value:,.0f}",
@@ -182,7 +134,7 @@ def create_rectangular_budget_breakdown(hierarchical_df):
         maxdepth=4,
         branchvalues="total",
         marker=dict(
-            colors=colors,
+            colors=df['color'],
             line=dict(color='white', width=0.8)
         ),
         textfont=dict(color='white', size=10, family="Arial"),
@@ -221,19 +173,25 @@ def create_dashboard(hierarchical, output=None):
                 os.makedirs(outputs_dir)
         output = os.path.join(outputs_dir, "dashboard.html")
     
-    budget_fig = create_rectangular_budget_breakdown(hierarchical)
-    
     total_budget = hierarchical[hierarchical['name'] == 'Total Budget']['value'].values[0]
     num_divisions = len(hierarchical[hierarchical['level'] == 1])
     num_categories = len(hierarchical[hierarchical['level'] == 2])
     
-    chart_html = budget_fig.to_html(
-        full_html=False, 
-        include_plotlyjs='cdn',
-        div_id="budget-chart"
-    )
+    page = FigurePage(output)
+    with stage("transform", "budget hierarchy"):
+        initial_nodes, subtrees = fold_split(
+            *split_levels(budget_nodes(hierarchical), id_col='id', parent_col='parent_id'), MAX_LEAVES,
+            id_col='id', parent_col='parent_id', value_col='value', label_cols=('name',)
+        )
+    chart_html = page.figure(create_rectangular_budget_breakdown, initial_nodes, div_id="budget-chart")
+    shard_dir = os.path.join(page.output_dir, "shards", "budget-chart")
+    clear_shards(shard_dir)
+    if subtrees:
+        manifest = write_shards(subtrees, ICICLE_SHARD_COLUMNS, shard_dir)
+        page.add_script(lazy_loader_script("budget-chart", manifest, page.output_dir))
     
-    html_content = f"""
+    with stage("assemble"):
+        html_content = f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -794,18 +752,22 @@ def create_dashboard(hierarchical, output=None):
             Use the path bar at the top to navigate back to parent levels.</p>
         </div>
     </div>
+    {page.scripts()}
 </body>
 </html>
 """
     
-    with open(output, "w", encoding="utf-8") as f:
+    with stage("write") as record, open(output, "w", encoding="utf-8") as f:
         f.write(html_content)
+        record["output_bytes"] = len(html_content.encode("utf-8"))
     print(f"Dashboard created successfully!")
 
 
 def main():
-    hierarchical = load_data()
-    create_dashboard(hierarchical)
+    with profile_run("Dashboard3"):
+        with stage("load"):
+            hierarchical = load_data()
+        create_dashboard(hierarchical)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,11 @@
+import os
+import sys
 import numpy as np
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.storage import write_table
+
 def generate_revenue_hierarchy(filename="../data/revenue_hierarchy.csv"):
     np.random.seed(42)
     
@@ -85,7 +90,7 @@ def generate_revenue_hierarchy(filename="../data/revenue_hierarchy.csv"):
     ]
     
     df = pd.DataFrame(hierarchy_data, columns=["region", "division", "product_category", "revenue", "growth_rate"])
-    df.to_csv(filename, index=False)
+    write_table(df, filename)
 
 def main():
     generate_revenue_hierarchy()
@@ -1,11 +1,48 @@
-import pandas as pd
+import os
+import sys
+import numpy as np
 import plotly.graph_objects as go
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.figure_page import FigurePage
+from common.hierarchy import clear_shards, fold_split, lazy_loader_script, node_table, split_levels, write_shards
+from common.palette import family_colors
+from common.profiling import profile_run, stage
+from common.storage import read_table
+
+HIERARCHY_LEVELS = ['region', 'division', 'product_category']
+# Smaller products beyond this are folded into an "Other" product per division,
+# separately on the page and in each drill-down shard
+MAX_PRODUCTS = 500
+# Trace attribute -> node table column, for the lazily loaded subtrees
+SUNBURST_SHARD_COLUMNS = {
+    'ids': 'ids', 'labels': 'labels', 'parents': 'parents', 'values': 'values',
+    'customdata': 'hover_text', 'marker.colors': 'color'
+}
+
 def load_data():
-    revenue_hierarchy = pd.read_csv("../data/revenue_hierarchy.csv")
+    revenue_hierarchy = read_table("../data/revenue_hierarchy.csv")
     return revenue_hierarchy
 
-def create_sunburst_chart(revenue_data):
+def sunburst_hover_text(nodes):
+    """Hover text of every node: its label, ancestors nearest first, revenue and growth"""
+    labels = nodes['labels'].to_numpy(dtype=object)
+    level = nodes['level'].to_numpy()
+    revenue = nodes['values'].map('${:,.0f}'.format).to_numpy(dtype=object)
+    growth = nodes['growth_rate'].map('{:.1f}%'.format).to_numpy(dtype=object)
+    
+    hover = 'Total Global Revenue: ' + revenue
+    for depth in range(1, len(HIERARCHY_LEVELS) + 1):
+        rows = level == depth
+        text = labels[rows]
+        for ancestor in reversed(HIERARCHY_LEVELS[:depth - 1]):
+            title = ancestor.replace('_', ' ').title()
+            text = text + f'<br>{title}: ' + nodes[ancestor].to_numpy(dtype=object)[rows]
+        growth_title = 'Growth Rate' if depth == len(HIERARCHY_LEVELS) else 'Avg Growth'
+        hover[rows] = text + '<br>Revenue: ' + revenue[rows] + f'<br>{growth_title}: ' + growth[rows]
+    return hover
+
+def sunburst_nodes(revenue_data):
     region_colors = {
         'North America': '#FF6B6B',
         'Europe': '#4ECDC4',
@@ -21,50 +58,6 @@ def create_sunburst_chart(revenue_data):
         'Financial Services': '#FDCB6E'
     }
     
-    sunburst_data = []
-    colors = []
-    
-    total_revenue = revenue_data['revenue'].sum()
-    sunburst_data.append({
-        'ids': 'Global Business',
-        'labels': 'Global Business',
-        'parents': '',
-        'values': total_revenue,
-        'hover_text': f'Total Global Revenue: ${total_revenue:,.0f}'
-    })
-    colors.append('#E8E8E8')
-    
-    region_totals = revenue_data.groupby('region').agg({
-        'revenue': 'sum',
-        'growth_rate': 'mean'
-    }).reset_index()
-    
-    for _, row in region_totals.iterrows():
-        sunburst_data.append({
-            'ids': row['region'],
-            'labels': row['region'],
-            'parents': 'Global Business',
-            'values': row['revenue'],
-            'hover_text': f"{row['region']}<br>Revenue: ${row['revenue']:,.0f}<br>Avg Growth: {row['growth_rate']:.1f}%"
-        })
-        colors.append(region_colors.get(row['region'], '#74B9FF'))
-    
-    division_totals = revenue_data.groupby(['region', 'division']).agg({
-        'revenue': 'sum',
-        'growth_rate': 'mean'
-    }).reset_index()
-    
-    for _, row in division_totals.iterrows():
-        division_id = f"{row['region']} - {row['division']}"
-        sunburst_data.append({
-            'ids': division_id,
-            'labels': row['division'],
-            'parents': row['region'],
-            'values': row['revenue'],
-            'hover_text': f"{row['division']}<br>Region: {row['region']}<br>Revenue: ${row['revenue']:,.0f}<br>Avg Growth: {row['growth_rate']:.1f}%"
-        })
-        colors.append(division_colors.get(row['division'], '#A29BFE'))
-    
     product_color_variations = {
         'Cloud Services': '#E17055', 'Software Licenses': '#0984E3', 'AI/ML Solutions': '#6C5CE7',
         'Data Analytics': '#00B894', 'Cybersecurity': '#E84393', 'Mobile Solutions': '#FDCB6E',
@@ -80,22 +73,35 @@ def create_sunburst_chart(revenue_data):
         'Construction': '#FF4757', 'Mining': '#7292D8', 'Medical Infrastructure': '#3742FA'
     }
     
-    for _, row in revenue_data.iterrows():
-        product_id = f"{row['region']} - {row['division']} - {row['product_category']}"
-        parent_id = f"{row['region']} - {row['division']}"
-        sunburst_data.append({
-            'ids': product_id,
-            'labels': row['product_category'],
-            'parents': parent_id,
-            'values': row['revenue'],
-            'hover_text': f"{row['product_category']}<br>Division: {row['division']}<br>Region: {row['region']}<br>Revenue: ${row['revenue']:,.0f}<br>Growth Rate: {row['growth_rate']:.1f}%"
-        })
-        product_color = product_color_variations.get(row['product_category'], 
-        division_colors.get(row['division'], '#A29BFE'))
-        colors.append(product_color)
+    df_sunburst = node_table(
+        revenue_data, HIERARCHY_LEVELS, 'revenue',
+        aggregations={'growth_rate': 'mean'}, root='Global Business'
+    )
+    # Deep levels of a large hierarchy are left out of the page and loaded on click
+    initial_nodes, subtrees = fold_split(
+        *split_levels(df_sunburst), MAX_PRODUCTS,
+        label_cols=('labels', 'product_category'), aggregations={'growth_rate': 'mean'}
+    )
     
-    df_sunburst = pd.DataFrame(sunburst_data)
+    def styled(nodes):
+        nodes = nodes.copy()
+        nodes['hover_text'] = sunburst_hover_text(nodes)
+        level = nodes['level'].to_numpy()
+        division_color = family_colors(nodes['division'], division_colors, default='#A29BFE')
+        nodes['color'] = np.select(
+            [level == 1, level == 2, level == 3],
+            [
+                family_colors(nodes['region'], region_colors, default='#74B9FF'),
+                division_color,
+                family_colors(nodes['product_category'], product_color_variations, default=division_color),
+            ],
+            '#E8E8E8'
+        )
+        return nodes
     
+    return styled(initial_nodes), {node_id: styled(rows) for node_id, rows in subtrees.items()}
+
+def create_sunburst_chart(df_sunburst):
     fig = go.Figure(go.Sunburst(
         ids=df_sunburst['ids'],
         labels=df_sunburst['labels'],
@@ -108,7 +114,7 @@ def create_sunburst_chart(revenue_data):
         insidetextorientation='radial',
         rotation=90,
         marker=dict(
-            colors=colors,
+            colors=df_sunburst['color'],
             line=dict(color="white", width=2)
         )
     ))
@@ -130,21 +136,29 @@ def create_sunburst_chart(revenue_data):
     return fig
 
 def create_dashboard(revenue_data, output="../outputs/dashboard.html"):
-    sunburst_fig = create_sunburst_chart(revenue_data)
-    
     total_revenue = revenue_data['revenue'].sum()
     avg_growth = revenue_data['growth_rate'].mean()
     total_regions = revenue_data['region'].nunique()
     total_products = revenue_data['product_category'].nunique()
     highest_growth_product = revenue_data.loc[revenue_data['growth_rate'].idxmax()]
     
-    sunburst_div = sunburst_fig.to_html(
-        full_html=False, 
-        include_plotlyjs='cdn',
+    page = FigurePage(output)
+    with stage("transform", "sunburst nodes"):
+        initial_nodes, subtrees = sunburst_nodes(revenue_data)
+    sunburst_div = page.figure(
+        create_sunburst_chart,
+        initial_nodes,
+        div_id='sunburst-chart',
         config={'displayModeBar': True, 'responsive': True}
     )
+    shard_dir = os.path.join(page.output_dir, 'shards', 'sunburst-chart')
+    clear_shards(shard_dir)
+    if subtrees:
+        manifest = write_shards(subtrees, SUNBURST_SHARD_COLUMNS, shard_dir)
+        page.add_script(lazy_loader_script('sunburst-chart', manifest, page.output_dir))
     
-    dashboard_html = f"""
+    with stage("assemble"):
+        dashboard_html = f"""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -495,16 +509,20 @@ def create_dashboard(revenue_data, output="../outputs/dashboard.html"):
                 </div>
             </div>
         </div>
+        {page.scripts()}
     </body>
     </html>
     """
     
-    with open(output, 'w', encoding='utf-8') as f:
+    with stage("write") as record, open(output, 'w', encoding='utf-8') as f:
         f.write(dashboard_html)
+        record["output_bytes"] = len(dashboard_html.encode("utf-8"))
 
 def main():
-    revenue_data = load_data()
-    create_dashboard(revenue_data)
+    with profile_run("Dashboard4"):
+        with stage("load"):
+            revenue_data = load_data()
+        create_dashboard(revenue_data)
     print("Dashboard created successfully!")
 
 if __name__ == "__main__":
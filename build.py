@@ -0,0 +1,161 @@
+"""Build every dashboard in the portfolio.
+
+Discovers ``DashboardN/scripts`` directories and runs their ``data_gen.py``
+and ``viz.py`` steps in a process pool. A step is submitted as soon as the
+steps it depends on have finished, so independent dashboards build
+concurrently and the whole portfolio takes about as long as the slowest one.
+
+    python build.py                     # all dashboards
+    python build.py Dashboard1 --skip-data
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import runpy
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Step name -> steps of the same dashboard it depends on
+STEPS = {
+    "data_gen": [],
+    "viz": ["data_gen"],
+}
+
+
+def discover_dashboards(root=REPO_ROOT):
+    dashboards = {}
+    for scripts_dir in sorted(glob.glob(os.path.join(root, "Dashboard*", "scripts"))):
+        name = os.path.basename(os.path.dirname(scripts_dir))
+        dashboards[name] = scripts_dir
+    return dashboards
+
+
+def run_step(scripts_dir, step):
+    """Run ``<scripts_dir>/<step>.py`` as ``__main__`` and return (seconds, captured output)"""
+    scripts_dir = os.path.abspath(scripts_dir)
+    script = os.path.join(scripts_dir, f"{step}.py")
+    output = io.StringIO()
+    cwd, argv, path, modules = os.getcwd(), sys.argv, list(sys.path), set(sys.modules)
+    start = time.perf_counter()
+    try:
+        # Run as `python <step>.py` from the scripts directory would: the scripts resolve
+        # data/outputs relative to it and import their sibling helper modules
+        os.chdir(scripts_dir)
+        sys.argv = [script]
+        sys.path.insert(0, scripts_dir)
+        with contextlib.redirect_stdout(output):
+            runpy.run_path(script, run_name="__main__")
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+        sys.path[:] = path
+        # Pool workers are reused; drop this dashboard's helper modules so another
+        # dashboard's module with the same name is not picked up from the cache
+        for name in set(sys.modules) - modules:
+            module_file = getattr(sys.modules[name], "__file__", None) or ""
+            if os.path.dirname(os.path.abspath(module_file)) == scripts_dir:
+                del sys.modules[name]
+    return time.perf_counter() - start, output.getvalue()
+
+
+def plan(dashboards, steps):
+    """Return {(dashboard, step): [dependencies]} for the steps that exist on disk"""
+    tasks = {}
+    for name, scripts_dir in dashboards.items():
+        for step in steps:
+            if os.path.exists(os.path.join(scripts_dir, f"{step}.py")):
+                deps = [dep for dep in STEPS[step] if dep in steps]
+                tasks[(name, step)] = [(name, dep) for dep in deps]
+    return tasks
+
+
+def build(dashboards, steps=tuple(STEPS), jobs=None):
+    """Run the planned steps and return {(dashboard, step): seconds}.
+
+    Raises the first step failure after letting running steps finish.
+    """
+    tasks = plan(dashboards, steps)
+    done, timings, running = set(), {}, {}
+    failure = None
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while len(done) < len(tasks) and failure is None:
+            for task, deps in tasks.items():
+                if task not in done and task not in running.values() and all(dep in done for dep in deps):
+                    running[pool.submit(run_step, dashboards[task[0]], task[1])] = task
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    timings[task], _ = future.result()
+                except Exception as e:
+                    failure = failure or RuntimeError(f"{task[0]} {task[1]}.py failed: {e!r}")
+                done.add(task)
+        wait(running)
+    if failure is not None:
+        raise failure
+    return timings
+
+
+def print_report(timings, wall):
+    print(f"{'Dashboard':<14}{'Step':<10}{'Seconds':>9}")
+    for (name, step), seconds in sorted(timings.items()):
+        print(f"{name:<14}{step:<10}{seconds:>9.2f}")
+    print(f"Built {len({name for name, _ in timings})} dashboards in {wall:.2f}s "
+          f"(steps total {sum(timings.values()):.2f}s)")
+
+
+def write_profile(report_dir, dashboards, timings, wall):
+    """Combine the step timings and each dashboard's stage report into build.json"""
+    reports = {}
+    for name in dashboards:
+        path = os.path.join(report_dir, f"{name}.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                reports[name] = json.load(f)
+    build_report = {
+        "wall_seconds": round(wall, 6),
+        "steps": [{"dashboard": name, "step": step, "seconds": round(seconds, 6)}
+                  for (name, step), seconds in sorted(timings.items())],
+        "dashboards": reports,
+    }
+    with open(os.path.join(report_dir, "build.json"), "w", encoding="utf-8") as f:
+        json.dump(build_report, f, indent=2)
+    print(f"Profile written to {os.path.join(report_dir, 'build.json')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the DashCraft dashboards in parallel")
+    parser.add_argument("dashboards", nargs="*", help="dashboards to build (default: all)")
+    parser.add_argument("--skip-data", action="store_true", help="only re-render, reuse existing data")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--profile", metavar="DIR", default=None,
+                        help="write per-stage timing/memory/size reports of the viz steps to DIR")
+    args = parser.parse_args()
+    if args.profile:
+        # Read by common.profiling in the worker processes
+        os.environ["DASHCRAFT_PROFILE"] = os.path.abspath(args.profile)
+
+    dashboards = discover_dashboards()
+    if args.dashboards:
+        unknown = set(args.dashboards) - set(dashboards)
+        if unknown:
+            parser.error(f"unknown dashboards: {', '.join(sorted(unknown))}")
+        dashboards = {name: dashboards[name] for name in args.dashboards}
+    steps = ("viz",) if args.skip_data else tuple(STEPS)
+
+    start = time.perf_counter()
+    timings = build(dashboards, steps, args.jobs)
+    wall = time.perf_counter() - start
+    print_report(timings, wall)
+    if args.profile:
+        write_profile(args.profile, dashboards, timings, wall)
+
+
+if __name__ == "__main__":
+    main()
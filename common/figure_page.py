@@ -0,0 +1,151 @@
+"""Figure embedding for the dashboard pages.
+
+``FigurePage.figure`` returns the HTML to place where a figure should appear
+and ``FigurePage.scripts`` the markup to put right before ``</body>``.
+
+With ``DASHCRAFT_PLOTLYJS=cdn`` (the default) figures are embedded exactly as
+``fig.to_html`` does: the first one loads plotly.js from the CDN and every
+figure carries its full JSON. With ``DASHCRAFT_PLOTLYJS=local`` the page
+instead loads a plotly.js vendored under ``assets/vendor``, every template is
+written once to a shared script there (so all dashboards reuse the same
+cached file), and identical layouts are emitted once per page.
+
+Scripts passed to ``FigurePage.add_script`` are emitted by ``scripts()``
+after the figures are drawn, in either mode.
+"""
+import hashlib
+import json
+import os
+
+import plotly
+from plotly.offline import get_plotlyjs
+
+from common.render_cache import render_figure, render_json
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+VENDOR_DIR = os.path.join(REPO_ROOT, "assets", "vendor")
+PLOTLYJS_MODE = os.environ.get("DASHCRAFT_PLOTLYJS", "cdn")
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), sort_keys=True)
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def _write_once(path, content):
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def vendor_plotlyjs(vendor_dir=VENDOR_DIR):
+    """Write the installed plotly.js bundle to ``vendor_dir`` and return its path"""
+    path = os.path.join(vendor_dir, f"plotly-{plotly.__version__}.min.js")
+    if not os.path.exists(path):
+        _write_once(path, get_plotlyjs())
+    return path
+
+
+def vendor_template(template, vendor_dir=VENDOR_DIR):
+    """Write ``template`` to a shared script registering it under its digest; return (key, path)"""
+    text = _dumps(template)
+    key = _digest(text)
+    path = os.path.join(vendor_dir, f"template-{key}.js")
+    _write_once(path, f"(window.DASHCRAFT_TEMPLATES = window.DASHCRAFT_TEMPLATES || {{}})[{_dumps(key)}] = {text};\n")
+    return key, path
+
+
+def escape_script(script_text):
+    """Escape ``</`` so inline JSON cannot close the surrounding <script> element"""
+    return script_text.replace("</", "<\\/")
+
+
+def _css_size(value, default="100%"):
+    if value is None:
+        return default
+    return f"{value}px" if isinstance(value, (int, float)) else str(value)
+
+
+class FigurePage:
+    def __init__(self, output, mode=None):
+        self.output_dir = os.path.dirname(os.path.abspath(output))
+        self.mode = mode or PLOTLYJS_MODE
+        self._rendered = 0
+        self._plots = []
+        self._layouts = {}
+        self._template_paths = {}
+        self._scripts = []
+
+    def _src(self, path):
+        return os.path.relpath(path, self.output_dir).replace(os.sep, "/")
+
+    def figure(self, builder, *args, div_id=None, config=None, **kwargs):
+        """Build (or reuse from the render cache) ``builder(*args, **kwargs)`` and return its HTML"""
+        self._rendered += 1
+        if self.mode == "cdn":
+            to_html = {"include_plotlyjs": "cdn" if self._rendered == 1 else False}
+            if div_id is not None:
+                to_html["div_id"] = div_id
+            if config is not None:
+                to_html["config"] = config
+            return render_figure(builder, *args, to_html=to_html, **kwargs)
+        if self.mode != "local":
+            raise ValueError(f"Unknown plotly.js mode: {self.mode!r}")
+
+        fig = json.loads(render_json(builder, *args, **kwargs))
+        layout = fig.get("layout", {})
+        template = layout.pop("template", None)
+        template_layout = (template or {}).get("layout", {})
+        width = layout.get("width", template_layout.get("width"))
+        height = layout.get("height", template_layout.get("height"))
+
+        template_key = None
+        if template is not None:
+            template_key, path = vendor_template(template)
+            self._template_paths[template_key] = path
+        layout_text = _dumps(layout)
+        layout_key = _digest(layout_text)
+        self._layouts[layout_key] = layout_text
+
+        div_id = div_id or f"dashcraft-figure-{self._rendered}"
+        self._plots.append({
+            "id": div_id,
+            "data": fig.get("data", []),
+            "layout": layout_key,
+            "template": template_key,
+            "config": {"responsive": True, **(config or {})},
+        })
+        return (f'<div id="{div_id}" class="plotly-graph-div" '
+                f'style="height:{_css_size(height)}; width:{_css_size(width)};"></div>')
+
+    def add_script(self, script):
+        self._scripts.append(script)
+
+    def scripts(self):
+        if self.mode == "cdn" or not self._plots:
+            return "\n".join(self._scripts)
+        tags = [f'<script src="{self._src(vendor_plotlyjs())}"></script>']
+        tags += [f'<script src="{self._src(path)}"></script>' for path in self._template_paths.values()]
+        layouts = "{" + ",".join(f"{_dumps(key)}:{text}" for key, text in self._layouts.items()) + "}"
+        plots = json.dumps(self._plots, separators=(",", ":"))
+        tags.append(f"""<script>
+(function() {{
+    var templates = window.DASHCRAFT_TEMPLATES || {{}};
+    var layouts = {escape_script(layouts)};
+    var plots = {escape_script(plots)};
+    plots.forEach(function(plot) {{
+        // Deep copy: Plotly mutates the layout it is given and layouts are shared
+        var layout = JSON.parse(JSON.stringify(layouts[plot.layout]));
+        if (plot.template) {{ layout.template = templates[plot.template]; }}
+        Plotly.newPlot(plot.id, plot.data, layout, plot.config);
+    }});
+}})();
+</script>""")
+        return "\n".join(tags + self._scripts)
@@ -0,0 +1,216 @@
+"""Hierarchy node tables for the sunburst/icicle charts.
+
+``node_table(df, ["region", "division", "product_category"], "revenue")``
+turns a flat table with one row per leaf into one row per node of the
+hierarchy, with the ``ids``/``labels``/``parents``/``values`` columns plotly
+expects. Each level is one grouped aggregation and its ids are built by
+concatenating string columns, so any number of levels and millions of leaf
+rows work without per-row Python. ``fold_leaves`` bounds the number of
+leaves by folding the smallest into an "Other" leaf under each parent;
+``fold_split`` does so for the page and each lazily loaded subtree apart.
+
+Large hierarchies are drawn lazily: ``split_levels`` keeps the top levels for
+the page and cuts everything deeper into one subtree per node of the last
+kept level, ``write_shards`` writes each subtree to a script under the
+outputs directory and ``lazy_loader_script`` adds them to the figure when
+their node is clicked. The shards register themselves on
+``window.DASHCRAFT_SHARDS`` like the vendored templates do, so they load from
+``file://`` pages as well as over HTTP.
+"""
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.figure_page import escape_script
+from common.ranking import OTHER_LABEL, top_n_positions
+
+SEPARATOR = " - "
+LAZY_NODE_LIMIT = int(os.environ.get("DASHCRAFT_LAZY_NODES", "2000"))
+
+
+def _join(frame, columns, sep=SEPARATOR):
+    joined = frame[columns[0]].astype(str).to_numpy(dtype=object)
+    for column in columns[1:]:
+        joined = joined + sep + frame[column].astype(str).to_numpy(dtype=object)
+    return joined
+
+
+def node_table(df, levels, value, aggregations=None, root=None, sep=SEPARATOR):
+    """Return one row per node, root first and then level by level.
+
+    ``value`` is summed and every {column: func} in ``aggregations`` applied
+    per node. Besides the plotly columns the table keeps the aggregated
+    columns, the node's ``level`` (1 for ``levels[0]``, 0 for the root) and
+    the ``levels`` columns holding the node's ancestors (NaN below its level).
+    Node ids join the path with ``sep``; with a ``root`` label the top level
+    hangs off a single root node.
+    """
+    agg = {value: "sum", **(aggregations or {})}
+    frames = []
+    if root is not None:
+        totals = df.agg(agg)
+        frames.append(pd.DataFrame({
+            "ids": [root], "labels": [root], "parents": [""], "level": [0],
+            **{column: [totals[column]] for column in agg},
+        }))
+
+    for depth in range(1, len(levels) + 1):
+        keys = list(levels[:depth])
+        nodes = df.groupby(keys, sort=True, observed=True).agg(agg).reset_index()
+        nodes["ids"] = _join(nodes, keys, sep)
+        nodes["labels"] = nodes[keys[-1]].astype(str).to_numpy(dtype=object)
+        if depth > 1:
+            nodes["parents"] = _join(nodes, keys[:-1], sep)
+        else:
+            nodes["parents"] = root if root is not None else ""
+        nodes["level"] = depth
+        frames.append(nodes)
+
+    table = pd.concat(frames, ignore_index=True)
+    table = table.rename(columns={value: "values"})
+    return table[["ids", "labels", "parents", "values", "level"]
+                 + [column for column in agg if column != value] + list(levels)]
+
+
+def fold_leaves(nodes, max_leaves, id_col="ids", parent_col="parents", value_col="values",
+                label_cols=("labels",), aggregations=None, other_label=OTHER_LABEL, sep=SEPARATOR,
+                keep=()):
+    """Keep the ``max_leaves`` largest leaves and fold the rest into one "Other" leaf per parent.
+
+    The "Other" leaf sums ``value_col``, so every parent keeps its total. Its
+    other columns take the first folded sibling's value unless
+    ``aggregations`` says otherwise, and ``label_cols`` are set to
+    ``other_label``. Nodes in ``keep`` (those whose children are loaded
+    later) are not leaves.
+    """
+    # A hash lookup of the ids in the parent column; np.isin compares object arrays pairwise
+    ids = pd.Index(nodes[id_col].to_numpy(dtype=object), dtype=object)
+    leaf = ~ids.isin(nodes[parent_col].to_numpy(dtype=object))
+    if len(keep):
+        leaf &= ~ids.isin(list(keep))
+    leaf_rows = np.flatnonzero(leaf)
+    if len(leaf_rows) <= max_leaves:
+        return nodes
+
+    kept = leaf_rows[top_n_positions(nodes[value_col].to_numpy()[leaf_rows], max_leaves)]
+    folded = leaf.copy()
+    folded[kept] = False
+    agg = {column: "first" for column in nodes.columns if column != parent_col}
+    agg.update({value_col: "sum", **(aggregations or {})})
+    other = nodes[folded].groupby(parent_col, sort=False).agg(agg).reset_index()
+    other[id_col] = other[parent_col].astype(str) + sep + other_label
+    for column in label_cols:
+        other[column] = other_label
+    return pd.concat([nodes[~folded], other[nodes.columns]], ignore_index=True)
+
+
+def split_levels(nodes, initial_depth=None, node_limit=LAZY_NODE_LIMIT,
+                 id_col="ids", parent_col="parents", level_col="level"):
+    """Split a node table into the rows drawn up front and the subtrees loaded later.
+
+    Rows down to ``initial_depth`` stay in the page; by default that is the
+    deepest level keeping at most ``node_limit`` rows (but at least level 1).
+    Returns (initial rows, {id of a node at ``initial_depth``: its descendants}).
+    """
+    level = nodes[level_col].to_numpy()
+    if initial_depth is None:
+        fitting = np.flatnonzero(np.cumsum(np.bincount(level)) <= node_limit)
+        initial_depth = max(int(fitting[-1]) if len(fitting) else 0, 1)
+    deeper = level > initial_depth
+    if not deeper.any():
+        return nodes, {}
+
+    # Climb every deeper row to its ancestor at initial_depth, one level per step
+    parent_of = pd.Series(nodes[parent_col].to_numpy(dtype=object), index=nodes[id_col].to_numpy(dtype=object))
+    ancestor = nodes[id_col].to_numpy(dtype=object)[deeper]
+    ancestor_level = level[deeper].copy()
+    while (ancestor_level > initial_depth).any():
+        climb = ancestor_level > initial_depth
+        ancestor[climb] = parent_of.reindex(ancestor[climb]).to_numpy(dtype=object)
+        ancestor_level[climb] -= 1
+
+    lazy = nodes[deeper]
+    subtrees = {node_id: rows for node_id, rows in lazy.groupby(ancestor, sort=False)}
+    return nodes[~deeper], subtrees
+
+
+def fold_split(initial, subtrees, max_leaves, **kwargs):
+    """``fold_leaves`` applied to the page rows and to each subtree of ``split_levels`` on its own.
+
+    Folding before the split would cap the whole hierarchy at ``max_leaves``
+    leaves, so a hierarchy large enough to be split would lose most of the
+    levels it defers; this caps what each page or shard draws instead.
+    """
+    initial = fold_leaves(initial, max_leaves, keep=list(subtrees), **kwargs)
+    return initial, {node_id: fold_leaves(rows, max_leaves, **kwargs) for node_id, rows in subtrees.items()}
+
+
+def clear_shards(shard_dir):
+    """Remove the shards a previous build wrote to ``shard_dir``"""
+    for stale in glob.glob(os.path.join(shard_dir, "*.js")):
+        os.remove(stale)
+
+
+def write_shards(subtrees, columns, shard_dir):
+    """Write each subtree to ``<shard_dir>/<key>.js``; return {node id: (key, path)}.
+
+    ``columns`` maps trace attributes ("ids", "marker.colors", ...) to the
+    node table columns holding them.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+
+    manifest = {}
+    for node_id, rows in subtrees.items():
+        key = hashlib.sha256(str(node_id).encode()).hexdigest()[:16]
+        payload = json.dumps({attr: rows[column].tolist() for attr, column in columns.items()},
+                             separators=(",", ":"))
+        path = os.path.join(shard_dir, f"{key}.js")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"(window.DASHCRAFT_SHARDS = window.DASHCRAFT_SHARDS || {{}})[{json.dumps(key)}] = {payload};\n")
+        manifest[node_id] = (key, path)
+    return manifest
+
+
+def lazy_loader_script(div_id, manifest, page_dir):
+    """Script that loads a node's shard on its first click and drills into it"""
+    shards = {
+        str(node_id): {"key": key, "src": os.path.relpath(path, page_dir).replace(os.sep, "/")}
+        for node_id, (key, path) in manifest.items()
+    }
+    shards_json = escape_script(json.dumps(shards, separators=(",", ":")))
+    return f"""<script>
+(function() {{
+    var div = document.getElementById({json.dumps(div_id)});
+    var shards = {shards_json};
+    function attach(id, shard) {{
+        var trace = div.data[0];
+        var update = {{level: id}};
+        Object.keys(shard).forEach(function(attr) {{
+            var current = attr.split('.').reduce(function(obj, key) {{ return obj && obj[key]; }}, trace);
+            update[attr] = [Array.from(current || []).concat(shard[attr])];
+        }});
+        Plotly.restyle(div, update, [0]);
+    }}
+    div.on('plotly_' + div.data[0].type + 'click', function(event) {{
+        var id = event.points[0].id;
+        var shard = shards[id];
+        if (!shard || shard.loaded) {{ return; }}
+        if (!shard.loading) {{
+            shard.loading = true;
+            var script = document.createElement('script');
+            script.src = shard.src;
+            script.onload = function() {{
+                shard.loaded = true;
+                attach(id, window.DASHCRAFT_SHARDS[shard.key]);
+            }};
+            document.head.appendChild(script);
+        }}
+        // Drill down once the subtree is there
+        return false;
+    }});
+}})();
+</script>"""
@@ -0,0 +1,70 @@
+"""Vectorized node colouring for the hierarchy charts.
+
+``family_colors`` looks every node's key up in a {key: hex colour} family map
+and shades it by a per-node factor: below 1 darkens toward black, above 1
+lightens toward white and exactly 1 keeps the base colour as it is. Only the
+distinct (base, factor) pairs are computed, with NumPy, and the resulting
+shades are cached for the life of the process.
+"""
+import numpy as np
+import pandas as pd
+
+_shades = {}
+
+
+def _hex_rgb(hex_colors):
+    digits = "".join(color[1:7] for color in hex_colors)
+    return np.frombuffer(bytes.fromhex(digits), dtype=np.uint8).reshape(-1, 3).astype(float)
+
+
+def _compute(pairs):
+    bases = [base for base, _ in pairs]
+    factors = np.array([factor for _, factor in pairs], dtype=float)[:, None]
+    rgb = _hex_rgb(bases)
+    shaded = np.where(factors < 1, rgb * factors, rgb + (255 - rgb) * (factors - 1))
+    shaded = np.clip(np.trunc(shaded), 0, 255).astype(int)
+    return [f"rgb({r},{g},{b})" for r, g, b in shaded.tolist()]
+
+
+def shade(bases, factors):
+    """Shade each hex colour in ``bases`` by the matching entry of ``factors``"""
+    bases = np.asarray(bases, dtype=object)
+    factors = np.broadcast_to(np.asarray(factors, dtype=float), bases.shape)
+    base_codes, base_uniques = pd.factorize(bases)
+    factor_codes, factor_uniques = pd.factorize(factors)
+    pair_codes, codes = np.unique(base_codes * len(factor_uniques) + factor_codes, return_inverse=True)
+    uniques = [(base_uniques[code // len(factor_uniques)], float(factor_uniques[code % len(factor_uniques)]))
+               for code in pair_codes]
+
+    missing = [pair for pair in uniques if pair not in _shades]
+    to_compute = [(base, factor) for base, factor in missing
+                  if factor != 1 and isinstance(base, str) and base.startswith("#")]
+    if to_compute:
+        _shades.update(zip(to_compute, _compute(to_compute)))
+    # Unit factors and non-hex colours ("rgb(...)", names) pass through unchanged
+    _shades.update((pair, pair[0]) for pair in missing if pair not in _shades)
+
+    colors = np.array([_shades[pair] for pair in uniques], dtype=object)
+    return colors[codes]
+
+
+def family_colors(keys, families, factors=1.0, default=None):
+    """Colour of every node: ``families[key]`` shaded by its factor.
+
+    Keys without a family take ``default``, either one colour or an array with
+    a colour per node; with no default they are left as None.
+    """
+    keys = np.asarray(keys, dtype=object)
+    key_codes, key_uniques = pd.factorize(keys)
+    # Missing keys get code -1, which picks the trailing None
+    bases = np.array([families.get(key) for key in key_uniques] + [None], dtype=object)[key_codes]
+    if default is not None:
+        unknown = pd.isna(bases)
+        bases[unknown] = np.broadcast_to(np.asarray(default, dtype=object), keys.shape)[unknown]
+
+    colors = np.full(len(keys), None, dtype=object)
+    known = ~pd.isna(bases)
+    if known.any():
+        factors = np.broadcast_to(np.asarray(factors, dtype=float), keys.shape)
+        colors[known] = shade(bases[known], factors[known])
+    return colors
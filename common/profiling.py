@@ -0,0 +1,101 @@
+"""Stage-level profiling for the dashboard builds.
+
+``profile_run(name)`` activates a profile when ``DASHCRAFT_PROFILE`` names a
+directory; ``stage(...)`` blocks anywhere inside it record wall time, peak
+traced memory above the stage's starting point and, when the block sets
+``record["output_bytes"]``, the size of what it produced. Stages may nest
+(a transform inside a figure build); each record keeps its inclusive
+``seconds`` and its ``self_seconds`` without the nested stages, and
+``seconds_by_stage`` sums the latter so no time is counted twice. On exit
+the profile is written to ``<DASHCRAFT_PROFILE>/<name>.json``. Without the variable every
+``stage`` is a no-op, so instrumented code pays nothing.
+"""
+import contextlib
+import json
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+import plotly
+
+_active = None
+
+
+class Profile:
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self._open = []
+        self._start = time.perf_counter()
+
+    def _fold_peak(self):
+        # reset_peak() is global, so push the peak seen so far into every open stage first
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self._open:
+            record["peak_bytes"] = max(record["peak_bytes"], peak - record["_start_bytes"])
+
+    @contextlib.contextmanager
+    def stage(self, name, label=None):
+        self._fold_peak()
+        tracemalloc.reset_peak()
+        record = {"stage": name, "label": label, "seconds": 0.0, "self_seconds": 0.0, "peak_bytes": 0,
+                  "_start_bytes": tracemalloc.get_traced_memory()[0], "_nested_seconds": 0.0}
+        self._open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter() - start
+            record["seconds"] = round(elapsed, 6)
+            record["self_seconds"] = round(elapsed - record.pop("_nested_seconds"), 6)
+            self._fold_peak()
+            self._open.remove(record)
+            if self._open:
+                self._open[-1]["_nested_seconds"] += elapsed
+            del record["_start_bytes"]
+            self.stages.append(record)
+
+    def report(self):
+        totals = {}
+        for record in self.stages:
+            totals[record["stage"]] = round(totals.get(record["stage"], 0.0) + record["self_seconds"], 6)
+        return {
+            "dashboard": self.name,
+            "total_seconds": round(time.perf_counter() - self._start, 6),
+            "seconds_by_stage": totals,
+            "stages": self.stages,
+            "versions": {"pandas": pd.__version__, "plotly": plotly.__version__},
+        }
+
+
+@contextlib.contextmanager
+def profile_run(name, report_dir=None):
+    global _active
+    report_dir = report_dir or os.environ.get("DASHCRAFT_PROFILE")
+    if not report_dir:
+        yield None
+        return
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    _active = Profile(name)
+    try:
+        yield _active
+    finally:
+        profile, _active = _active, None
+        if started_tracing:
+            tracemalloc.stop()
+        os.makedirs(report_dir, exist_ok=True)
+        with open(os.path.join(report_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(profile.report(), f, indent=2)
+
+
+@contextlib.contextmanager
+def stage(name, label=None):
+    if _active is None:
+        yield {}
+        return
+    with _active.stage(name, label) as record:
+        yield record
@@ -0,0 +1,49 @@
+"""Top-N selection with the remainder folded into an "Other" entry.
+
+``top_n_positions`` ranks with ``np.partition``, so picking the N largest
+of M values costs O(M + N log N) instead of a full sort, and ``top_n`` keeps
+the totals right by summing everything it drops into one extra row.
+"""
+import numpy as np
+import pandas as pd
+
+OTHER_LABEL = "Other"
+
+
+def top_n_positions(values, n):
+    """Positions of the ``n`` largest values, largest first; ties keep their original order"""
+    values = np.asarray(values, dtype=float)
+    if n >= len(values):
+        return np.lexsort((np.arange(len(values)), -values))
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    negated = -values
+    cutoff = np.partition(negated, n - 1)[n - 1]
+    # Everything strictly above the n-th largest value is in; among the values
+    # tied with it, the earliest positions fill the remaining places
+    if np.isnan(cutoff):
+        above, tied = ~np.isnan(negated), np.isnan(negated)
+    else:
+        above, tied = negated < cutoff, negated == cutoff
+    above = np.flatnonzero(above)
+    top = np.concatenate([above, np.flatnonzero(tied)[:n - len(above)]])
+    return top[np.lexsort((top, negated[top]))]
+
+
+def top_n(df, value, n, label_col, sum_cols=None, other_label=OTHER_LABEL):
+    """Rows with the ``n`` largest ``value``, largest first, plus an ``other_label`` row.
+
+    The "Other" row sums ``sum_cols`` (default: just ``value``) over the rows
+    left out and is only added when something was left out.
+    """
+    positions = top_n_positions(df[value], n)
+    top = df.iloc[positions]
+    if len(positions) == len(df):
+        return top.reset_index(drop=True)
+
+    rest = np.ones(len(df), dtype=bool)
+    rest[positions] = False
+    other = df.loc[rest, sum_cols or [value]].sum().to_frame().T
+    other[label_col] = other_label
+    return pd.concat([top, other[[column for column in df.columns if column in other.columns]]],
+                     ignore_index=True)
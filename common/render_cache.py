@@ -0,0 +1,113 @@
+"""Content-addressed cache of rendered figure HTML fragments.
+
+``render_figure(builder, *args, **kwargs)`` returns
+``builder(*args, **kwargs).to_html(**to_html)`` and stores the fragment on
+disk under a key made from the source of the builder's directory and of
+``common`` (where the helpers it calls live), the contents of every
+DataFrame/Series argument, the remaining arguments and the plotly version. A
+later call with the same inputs reads the fragment back without building the
+figure. Set ``DASHCRAFT_RENDER_CACHE=0`` to always rebuild.
+"""
+import glob
+import hashlib
+import inspect
+import os
+
+import pandas as pd
+import plotly
+
+from common.profiling import stage
+
+COMMON_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.join(COMMON_DIR, "..")
+CACHE_DIR = os.environ.get("DASHCRAFT_CACHE_DIR", os.path.join(REPO_ROOT, ".cache", "figures"))
+CACHE_ENABLED = os.environ.get("DASHCRAFT_RENDER_CACHE", "1") != "0"
+
+_source_digests = {}
+
+
+def data_digest(value):
+    """Hash a DataFrame or Series by content, including column names and dtypes"""
+    h = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        h.update(repr(list(zip(value.columns, value.dtypes.astype(str)))).encode())
+    else:
+        h.update(repr((value.name, str(value.dtype))).encode())
+    h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _file_digest(path):
+    if path not in _source_digests:
+        with open(path, "rb") as f:
+            _source_digests[path] = hashlib.sha256(f.read()).hexdigest()
+    return _source_digests[path]
+
+
+def _source_digest(builder):
+    builder_dir = os.path.dirname(os.path.abspath(inspect.getsourcefile(builder)))
+    paths = sorted(glob.glob(os.path.join(builder_dir, "*.py"))) + sorted(glob.glob(os.path.join(COMMON_DIR, "*.py")))
+    return [_file_digest(path) for path in paths]
+
+
+def _describe(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return data_digest(value)
+    return repr(value)
+
+
+def cache_key(builder, args, kwargs, to_html):
+    parts = [
+        plotly.__version__,
+        builder.__module__,
+        builder.__qualname__,
+        _source_digest(builder),
+        [_describe(arg) for arg in args],
+        sorted((name, _describe(value)) for name, value in kwargs.items()),
+        sorted(to_html.items()),
+    ]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def _cached(key, suffix, label, produce):
+    path = os.path.join(CACHE_DIR, key + suffix)
+    if os.path.exists(path):
+        with stage("cache read", label) as record, open(path, encoding="utf-8") as f:
+            content = f.read()
+            record["output_bytes"] = len(content.encode("utf-8"))
+        return content
+
+    content = produce()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return content
+
+
+def _produce(builder, args, kwargs, serialize):
+    with stage("figure build", builder.__name__):
+        fig = builder(*args, **kwargs)
+    with stage("serialize", builder.__name__) as record:
+        content = serialize(fig)
+        record["output_bytes"] = len(content.encode("utf-8"))
+    return content
+
+
+def render_figure(builder, *args, to_html=None, **kwargs):
+    to_html = {"full_html": False, "include_plotlyjs": False, **(to_html or {})}
+    produce = lambda: _produce(builder, args, kwargs, lambda fig: fig.to_html(**to_html))
+    if not CACHE_ENABLED:
+        return produce()
+    key = cache_key(builder, args, kwargs, to_html)
+    return _cached(key, ".html", builder.__name__, produce)
+
+
+def render_json(builder, *args, **kwargs):
+    """Like ``render_figure`` but returns and caches the figure's plotly JSON"""
+    produce = lambda: _produce(builder, args, kwargs, lambda fig: fig.to_json())
+    if not CACHE_ENABLED:
+        return produce()
+    key = cache_key(builder, args, kwargs, {"format": "json"})
+    return _cached(key, ".json", builder.__name__, produce)
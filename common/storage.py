@@ -0,0 +1,157 @@
+"""Columnar storage for the dashboard datasets.
+
+Every dataset is addressed by its CSV path. Writers store the CSV plus a
+Feather sibling (``requests_log.csv`` -> ``requests_log.feather``) in which
+repetitive text columns are dictionary-encoded categoricals and timestamps
+keep their type, so readers skip text and date parsing entirely. Readers use
+the Feather copy when pyarrow is installed and the copy is at least as new as
+the CSV, and fall back to the CSV otherwise; appends only grow the CSV and drop
+the Feather copy until the next full write. Set ``DASHCRAFT_STORAGE=csv``
+to read and write CSV only.
+
+Both formats are memory-mapped rather than read through a buffer, and
+``read_tables`` reads a dashboard's datasets on a thread pool, so a cold
+start waits for the slowest file rather than the sum of them.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:
+    pa = None
+
+STORAGE_FORMAT = os.environ.get("DASHCRAFT_STORAGE", "feather")
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_RATIO = 0.5
+
+
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".feather"
+
+
+def columnar_enabled():
+    return pa is not None and STORAGE_FORMAT != "csv"
+
+
+def _use_columnar(csv_path):
+    if not columnar_enabled():
+        return False
+    path = columnar_path(csv_path)
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path)
+
+
+def to_columnar(df):
+    """Return ``df`` with its low-cardinality text columns as categoricals"""
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(values):
+            continue
+        if values.nunique() <= len(values) * CATEGORY_RATIO:
+            df[col] = values.astype("category")
+    return df
+
+
+def write_table(df, csv_path):
+    df.to_csv(csv_path, index=False)
+    if columnar_enabled():
+        to_columnar(df).to_feather(columnar_path(csv_path), compression="uncompressed")
+
+
+def append_table(df, csv_path):
+    """Append ``df``'s rows to the dataset at ``csv_path``.
+
+    Only the CSV grows: a Feather file cannot be appended to in place, and
+    rewriting it would make every append as slow as a full write. The
+    Feather copy is removed instead, so readers use the CSV until the next
+    ``write_table`` or ``TableWriter`` build writes a new one.
+    """
+    df.to_csv(csv_path, mode="a", index=False, header=False)
+    path = columnar_path(csv_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def read_table(csv_path, columns=None, **csv_kwargs):
+    """Read the dataset stored at ``csv_path``.
+
+    ``csv_kwargs`` (``parse_dates``, ``dtype``, ...) only apply to the CSV
+    fallback; the Feather copy already carries the column types.
+    """
+    if _use_columnar(csv_path):
+        # The copies are uncompressed, so mapping them reads only the pages used
+        return feather.read_table(columnar_path(csv_path), columns=columns, memory_map=True).to_pandas()
+    csv_kwargs.setdefault("memory_map", True)
+    return pd.read_csv(csv_path, usecols=columns, **csv_kwargs)
+
+
+def read_tables(tables, max_workers=None):
+    """Read several datasets at once and return them in order.
+
+    Each entry of ``tables`` is a CSV path or a (path, ``read_table``
+    keyword arguments) pair. The first failing read's exception is raised.
+    """
+    specs = [(table, {}) if isinstance(table, str) else table for table in tables]
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(specs), 1)) as pool:
+        futures = [pool.submit(read_table, path, **kwargs) for path, kwargs in specs]
+        return [future.result() for future in futures]
+
+
+def iter_table(csv_path, chunksize, columns=None, **csv_kwargs):
+    """Yield the dataset at ``csv_path`` as frames of bounded size.
+
+    Feather copies are read one record batch at a time, so the chunk size is
+    the one they were written with; CSVs are read ``chunksize`` rows at a time.
+    """
+    if not _use_columnar(csv_path):
+        yield from pd.read_csv(csv_path, usecols=columns, chunksize=chunksize, **csv_kwargs)
+        return
+    with pa.memory_map(columnar_path(csv_path)) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            table = pa.Table.from_batches([reader.get_batch(i)], schema=reader.schema)
+            if columns is not None:
+                table = table.select(columns)
+            yield table.to_pandas()
+
+
+class TableWriter:
+    """Append DataFrame chunks to a CSV and its Feather sibling.
+
+    All chunks must share the same columns and categorical categories, since
+    a Feather file holds a single dictionary per column.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self._csv = None
+        self._sink = None
+        self._writer = None
+        self._schema = None
+
+    def __enter__(self):
+        self._csv = open(self.csv_path, "w", newline="", encoding="utf-8")
+        return self
+
+    def write(self, df):
+        df.to_csv(self._csv, index=False, header=self._csv.tell() == 0)
+        if not columnar_enabled():
+            return
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._sink = pa.OSFile(columnar_path(self.csv_path), "wb")
+            self._writer = pa.ipc.new_file(self._sink, self._schema)
+        self._writer.write_table(table)
+
+    def __exit__(self, *exc_info):
+        self._csv.close()
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
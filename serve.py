@@ -0,0 +1,277 @@
+"""Serve the dashboards and a JSON query API over their datasets.
+
+Static files are served from the repository root, limited to the portfolio
+page, ``assets/`` and every ``DashboardN/outputs/`` (the dashboards and their
+shards); everything else, including the data and the figure cache, is 404.
+``/api/<dashboard>/<table>`` answers queries over the dashboard's dataset,
+loaded once per process and reloaded when its file changes; answers are
+kept in an LRU cache keyed by the query and the file version, so repeated
+drill-downs do not touch pandas again. Values that do not parse as the
+column's type, or as a date for ``start``/``end``, are a 400.
+
+    python serve.py                      # http://127.0.0.1:8050/
+    python serve.py --port 9000 --cache-size 1024
+
+Query parameters, all optional:
+
+    <column>=<value>   keep rows whose column equals one of the given values (repeatable)
+    start, end         inclusive date range on the table's date column
+    group_by           comma separated columns to aggregate by
+    value              column to sum per group, or to rank rows by (default: row count)
+    top                keep the N largest groups (the rest summed into "Other") or rows
+    columns, limit     columns and number of rows returned without group_by (limit 1000)
+
+e.g. ``/api/Dashboard1/requests?status=Open&start=2024-06-01&group_by=department&top=5``.
+``/api/tables`` lists the tables and their columns.
+"""
+import argparse
+import functools
+import json
+import os
+import posixpath
+import re
+import sys
+import threading
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_ROOT)
+from common.ranking import top_n, top_n_positions
+from common.storage import columnar_path, read_table
+
+# Dashboard -> table name -> (dataset under DashboardN/data, date column)
+TABLES = {
+    "Dashboard1": {"requests": ("requests_log.csv", "created_at")},
+    "Dashboard2": {"trips": ("trips.csv", "date")},
+    "Dashboard3": {"expenses": ("hierarchical_expenses.csv", None)},
+    "Dashboard4": {"revenue": ("revenue_hierarchy.csv", None)},
+}
+STATIC_PATHS = re.compile(r"/(index\.html)?$|/(assets|Dashboard\d+/outputs)(/|$)")
+RESERVED_PARAMS = {"start", "end", "group_by", "value", "top", "columns", "limit"}
+DEFAULT_LIMIT = 1000
+CACHE_SIZE = 256
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _dataset(dashboard, table):
+    try:
+        filename, date_col = TABLES[dashboard][table]
+    except KeyError:
+        raise LookupError(f"Unknown table: {dashboard}/{table}") from None
+    return os.path.join(REPO_ROOT, dashboard, "data", filename), date_col
+
+
+def table_version(dashboard, table):
+    """Modification time of the dataset's newest copy (CSV or Feather)"""
+    path, _ = _dataset(dashboard, table)
+    copies = [p for p in (path, columnar_path(path)) if os.path.exists(p)]
+    if not copies:
+        raise LookupError(f"No data for {dashboard}/{table}; run its data_gen.py first")
+    return max(os.stat(p).st_mtime_ns for p in copies)
+
+
+_frames = {}
+_frames_lock = threading.Lock()
+
+
+def load_table(dashboard, table, version):
+    """The table as a DataFrame, read again only when ``version`` changes"""
+    with _frames_lock:
+        cached = _frames.get((dashboard, table))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        path, date_col = _dataset(dashboard, table)
+        df = read_table(path, parse_dates=[date_col] if date_col else None)
+        if date_col:
+            df[date_col] = pd.to_datetime(df[date_col])
+        _frames[(dashboard, table)] = (version, df)
+        return df
+
+
+def _columns(df, names):
+    missing = [name for name in names if name not in df.columns]
+    if missing:
+        raise QueryError(f"Unknown column(s): {', '.join(missing)}")
+    return names
+
+
+def _single(params, name, convert=str):
+    if name not in params:
+        return None
+    try:
+        return convert(params[name][-1])
+    except ValueError:
+        raise QueryError(f"Invalid {name}: {params[name][-1]!r}") from None
+
+
+def _timestamp(text):
+    timestamp = pd.Timestamp(text)
+    if pd.isna(timestamp):
+        # pd.Timestamp("") is NaT, which would match no rows
+        raise ValueError(text)
+    return timestamp
+
+
+def run_query(df, params, date_col=None):
+    """Apply the query ``params`` ({name: [values]}) to ``df``; return (number of matching rows, result frame)"""
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in params.items():
+        if column in RESERVED_PARAMS:
+            continue
+        series = df[_columns(df, [column])[0]]
+        if pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+            numbers = pd.to_numeric(pd.Series(values), errors="coerce")
+            if numbers.isna().any():
+                raise QueryError(f"Invalid {column}: {values[int(np.argmax(numbers.isna()))]!r} is not a number")
+            values = numbers
+        mask &= series.isin(values).to_numpy()
+
+    start, end = _single(params, "start", _timestamp), _single(params, "end", _timestamp)
+    if start is not None or end is not None:
+        if date_col is None:
+            raise QueryError("This table has no date column")
+        dates = df[date_col]
+        if start is not None:
+            mask &= (dates >= start).to_numpy()
+        if end is not None:
+            # A bare date includes the whole day
+            mask &= (dates < end + pd.Timedelta(days=1) if end == end.normalize() else dates <= end).to_numpy()
+
+    rows = df[mask]
+    matched = len(rows)
+    value = _single(params, "value")
+    if value is not None:
+        series = df[_columns(df, [value])[0]]
+        if not pd.api.types.is_numeric_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+            raise QueryError(f"value must be a numeric column, not {value!r}")
+    top = _single(params, "top", int)
+    if top is not None and top < 0:
+        raise QueryError("top must not be negative")
+    limit = _single(params, "limit", int)
+    if limit is not None and limit < 0:
+        raise QueryError("limit must not be negative")
+
+    group_by = _single(params, "group_by")
+    if group_by:
+        keys = _columns(df, group_by.split(","))
+        grouped = rows.groupby(keys, observed=True, sort=True)
+        result = (grouped[value].sum() if value else grouped.size()).rename(value or "count").reset_index()
+        for key in keys:
+            if isinstance(result[key].dtype, pd.CategoricalDtype):
+                result[key] = result[key].astype(object)
+        if top is not None:
+            result = top_n(result, value or "count", top, label_col=keys[0])
+        return matched, result
+
+    if top is not None:
+        if value is None:
+            raise QueryError("top without group_by needs a value column to rank rows by")
+        rows = rows.iloc[top_n_positions(rows[value].to_numpy(), top)]
+    columns = _single(params, "columns")
+    if columns:
+        rows = rows[_columns(df, columns.split(","))]
+    return matched, rows.head(DEFAULT_LIMIT if limit is None else limit)
+
+
+def query(dashboard, table, params):
+    """JSON answer (bytes) of a query; ``params`` is a sorted tuple of (name, values) pairs"""
+    return _cached_query(dashboard, table, table_version(dashboard, table), params)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _cached_query(dashboard, table, version, params):
+    _, date_col = _dataset(dashboard, table)
+    matched, result = run_query(load_table(dashboard, table, version), dict(params), date_col)
+    data = result.to_json(orient="split", index=False, date_format="iso")
+    return f'{{"dashboard":{json.dumps(dashboard)},"table":{json.dumps(table)},"matched":{matched},"result":{data}}}'.encode()
+
+
+def table_listing():
+    listing = {}
+    for dashboard, tables in TABLES.items():
+        for table, (_, date_col) in tables.items():
+            try:
+                df = load_table(dashboard, table, table_version(dashboard, table))
+            except LookupError:
+                continue
+            listing.setdefault(dashboard, {})[table] = {
+                "rows": len(df), "date_column": date_col, "columns": [str(c) for c in df.columns],
+            }
+    return json.dumps(listing).encode()
+
+
+class DashboardHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=REPO_ROOT, **kwargs)
+
+    def send_head(self):
+        # Shared by GET and HEAD for static files
+        path = posixpath.normpath(unquote(urlsplit(self.path).path))
+        if not STATIC_PATHS.match(path):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return None
+        return super().send_head()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts[0] != "api":
+            return super().do_GET()
+        try:
+            if parts[1:] == ["tables"]:
+                body = table_listing()
+            elif len(parts) == 3:
+                params = parse_qs(url.query, keep_blank_values=True)
+                body = query(parts[1], parts[2], tuple(sorted((k, tuple(v)) for k, v in params.items())))
+            else:
+                raise LookupError(f"Unknown endpoint: {url.path}")
+        except LookupError as e:
+            return self._send_json(HTTPStatus.NOT_FOUND, json.dumps({"error": str(e)}).encode())
+        except QueryError as e:
+            return self._send_json(HTTPStatus.BAD_REQUEST, json.dumps({"error": str(e)}).encode())
+        except Exception as e:
+            self.log_error("query %s failed: %r", self.path, e)
+            return self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, json.dumps({"error": repr(e)}).encode())
+        self._send_json(HTTPStatus.OK, body)
+
+    def _send_json(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    global _cached_query
+    parser = argparse.ArgumentParser(description="Serve the DashCraft dashboards and their query API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="query results kept in the LRU cache")
+    args = parser.parse_args()
+    if args.cache_size != CACHE_SIZE:
+        _cached_query = functools.lru_cache(maxsize=args.cache_size)(_cached_query.__wrapped__)
+
+    server = ThreadingHTTPServer((args.host, args.port), DashboardHandler)
+    base = f"http://{args.host}:{args.port}"
+    print(f"Serving on {base}/")
+    for dashboard in TABLES:
+        print(f"  {base}/{dashboard}/outputs/dashboard.html")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, "Dashboard1", "scripts"))
+sys.path.append(os.path.join(REPO_ROOT, "Dashboard2", "scripts"))
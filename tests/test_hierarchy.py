@@ -0,0 +1,42 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from common.hierarchy import fold_leaves, node_table
+from common.ranking import OTHER_LABEL
+
+
+def _flat(n_parents, leaves_per_parent, seed=0):
+    rng = np.random.default_rng(seed)
+    n = n_parents * leaves_per_parent
+    return pd.DataFrame({
+        "group": np.repeat([f"g{i}" for i in range(n_parents)], leaves_per_parent),
+        "item": [f"i{i}" for i in range(n)],
+        "value": rng.integers(1, 1000, n),
+    })
+
+
+def test_fold_leaves_keeps_largest_and_parent_totals():
+    nodes = node_table(_flat(5, 20), ["group", "item"], "value", root="All")
+    folded = fold_leaves(nodes, 30)
+
+    leaves = folded[folded["level"] == 2]
+    other = leaves["labels"] == OTHER_LABEL
+    assert (~other).sum() == 30
+    assert set(leaves.loc[~other, "ids"]) == set(nodes[nodes["level"] == 2].nlargest(30, "values")["ids"])
+    totals = leaves.groupby("parents")["values"].sum()
+    expected = nodes[nodes["level"] == 1].set_index("ids")["values"]
+    pd.testing.assert_series_equal(totals.sort_index(), expected.sort_index(), check_names=False)
+
+
+def test_fold_leaves_scales_to_large_tables():
+    nodes = node_table(_flat(1000, 200), ["group", "item"], "value", root="All")
+    start = time.perf_counter()
+    folded = fold_leaves(nodes, 500)
+    elapsed = time.perf_counter() - start
+
+    assert ((folded["level"] == 2) & (folded["labels"] != OTHER_LABEL)).sum() == 500
+    assert folded["values"].iloc[0] == nodes["values"].iloc[0]
+    # Comparing ids to parents pairwise takes minutes at this size
+    assert elapsed < 5
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from kpis import TOTAL_COLUMNS, compute_kpis, kpis_from_csv, period_totals
+
+
+def _trips(dates):
+    return pd.DataFrame({"date": dates, "revenue": 1.0, "total_miles": 1.0, "shipping_cost": 1.0, "on_time": 1})
+
+
+def test_weeks_run_monday_to_sunday():
+    totals = period_totals(_trips(["2024-12-29", "2024-12-30", "2025-01-05", "2025-01-06"]), "W")
+    assert [str(period.start_time.date()) for period in totals.index] == ["2024-12-23", "2024-12-30", "2025-01-06"]
+    assert totals["trips"].tolist() == [1, 2, 1]
+    assert compute_kpis(totals, "W")["period"].iloc[0] == "Week of 06 Jan 2025"
+
+
+def test_empty_trips(tmp_path):
+    trips_csv = tmp_path / "trips.csv"
+    trips_csv.write_text(",".join(["date"] + TOTAL_COLUMNS[1:]) + "\n")
+    for kpis in (kpis_from_csv(str(trips_csv)), compute_kpis(period_totals(_trips([])))):
+        assert (kpis["value"] == 0).all()
+        assert (kpis["period"] == "No trips").all()
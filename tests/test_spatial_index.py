@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from spatial_index import GridIndex, haversine_km
+
+
+def _points(n, lat_range, lon_range, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(*lat_range, n), rng.uniform(*lon_range, n)
+
+
+@pytest.mark.parametrize("lat_range, lon_range", [
+    ((40.35, 40.65), (-80.25, -79.75)),
+    ((-80.0, 80.0), (-170.0, 170.0)),
+    ((60.0, 89.0), (-30.0, 30.0)),
+])
+def test_query_radius_matches_brute_force(lat_range, lon_range):
+    lat, lon = _points(20000, lat_range, lon_range)
+    index = GridIndex(lat, lon, grid_size=32)
+    rng = np.random.default_rng(1)
+    span_km = haversine_km(lat_range[0], lon_range[0], lat_range[1], lon_range[1])
+    for q in rng.integers(0, len(lat), 50):
+        radius = rng.uniform(0.01, 0.5) * span_km
+        expected = np.flatnonzero(haversine_km(lat[q], lon[q], lat, lon) <= radius)
+        np.testing.assert_array_equal(index.query_radius(lat[q], lon[q], radius), expected)
+
+
+def test_query_radius_keeps_points_at_the_edge():
+    # Grid rows 0.001 degrees high with a row edge at 40.47212, between the
+    # point below and the edge of a box 13.209 / 111.32 degrees tall
+    lat, lon = _points(5000, (40.47, 40.75), (-80.25, -79.75))
+    lat = np.concatenate([lat, [40.46212, 40.76212, 40.4721]])
+    lon = np.concatenate([lon, [-80.25, -79.75, -80.0142]])
+    index = GridIndex(lat, lon, grid_size=300)
+    assert haversine_km(40.5908, -80.0166, 40.4721, -80.0142) <= 13.209
+    assert len(lat) - 1 in index.query_radius(40.5908, -80.0166, 13.209)
+
+
+def test_query_box_matches_brute_force_and_empty_boxes():
+    lat, lon = _points(10000, (40.35, 40.65), (-80.25, -79.75))
+    index = GridIndex(lat, lon)
+    inside = (lat >= 40.4) & (lat <= 40.5) & (lon >= -80.1) & (lon <= -79.9)
+    np.testing.assert_array_equal(index.query_box(40.4, 40.5, -80.1, -79.9), np.flatnonzero(inside))
+    assert len(index.query_box(40.5, 40.4, -80.1, -79.9)) == 0
+    assert len(index.query_box(40.4, 40.5, -79.9, -80.1)) == 0